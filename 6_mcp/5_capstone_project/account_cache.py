@@ -0,0 +1,136 @@
+import atexit
+import os
+import threading
+import time
+from dotenv import load_dotenv
+from database import transaction, VersionConflict
+
+load_dotenv(override=True)
+
+# How long a cached account is kept before it is re-read from the database; 0 disables the cache.
+ACCOUNT_CACHE_TTL_SECONDS = float(os.getenv("ACCOUNT_CACHE_TTL_SECONDS", "60"))
+# A hit on an entry last checked longer ago than this is first checked against the account's stored
+# version, so changes made by other processes (reset.py, the UI, another trader's server) are seen
+# within this long, while a burst of reads costs one version query rather than one each.
+# This process's own writes change the cached account itself, so they never leave it stale.
+ACCOUNT_CACHE_CHECK_SECONDS = float(os.getenv("ACCOUNT_CACHE_CHECK_SECONDS", "2"))
+
+# With a positive interval, account writes are queued and committed together at most this many
+# seconds later instead of immediately. Only suitable when one process owns each account: a queued
+# write that meets a concurrent change is discarded rather than retried.
+ACCOUNT_WRITE_BEHIND_SECONDS = float(os.getenv("ACCOUNT_WRITE_BEHIND_SECONDS", "0"))
+
+
+class AccountCache:
+    """
+    Read-through cache of loaded accounts keyed by name, with hit/miss counters and optional
+    write-behind persistence of the row writes an account makes. When get() is given a way to read
+    the stored version, a cached copy is only returned while it is still at that version, checked at
+    most once every check_interval seconds per account.
+    """
+
+    def __init__(self, ttl: float = ACCOUNT_CACHE_TTL_SECONDS, write_behind: float = ACCOUNT_WRITE_BEHIND_SECONDS,
+                 check_interval: float = ACCOUNT_CACHE_CHECK_SECONDS):
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self.write_behind = write_behind
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.flushes = 0
+        self._entries = {}
+        self._pending = []
+        self._lock = threading.RLock()
+        if write_behind > 0:
+            threading.Thread(target=self._flush_periodically, name="account-write-behind", daemon=True).start()
+            atexit.register(self.flush)
+
+    def get(self, name: str, load, stored_version=None):
+        """
+        Return the cached value for name, calling load(name) on a miss, once the entry has expired, or
+        when stored_version(name) shows another writer has moved the stored copy past the cached one.
+        """
+        with self._lock:
+            entry = self._entries.get(name)
+            now = time.monotonic()
+            if entry and now - entry[1] < self.ttl:
+                value, loaded, checked = entry
+                # Queued writes are ahead of the database, and only this process writes in that mode
+                if stored_version is None or self._pending or now - checked < self.check_interval:
+                    self.hits += 1
+                    return value
+                if stored_version(name) == value.version:
+                    self.hits += 1
+                    self._entries[name] = (value, loaded, now)
+                    return value
+                self.stale += 1
+            self.misses += 1
+            # Queued writes must land before the database is read again
+            self.flush()
+            value = load(name)
+            if self.ttl > 0:
+                now = time.monotonic()
+                self._entries[name] = (value, now, now)
+            return value
+
+    def invalidate(self, name: str | None = None) -> None:
+        """Drop one account from the cache, or every account when name is None."""
+        with self._lock:
+            if name is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(name.lower(), None)
+
+    def write(self, fn, *args) -> None:
+        """Persist now, or queue the write for the next flush in write-behind mode."""
+        if self.write_behind > 0:
+            with self._lock:
+                self._pending.append((fn, args))
+        else:
+            try:
+                fn(*args)
+            except Exception:
+                # The cached objects have already been changed, so they no longer match the database
+                self.invalidate()
+                raise
+
+    def flush(self) -> None:
+        """
+        Commit every queued write in one transaction; on failure they stay queued for the next attempt.
+        If another writer changed one of the accounts meanwhile, the queued writes can never apply:
+        they are dropped along with the cached accounts, and VersionConflict is raised.
+        """
+        with self._lock:
+            if not self._pending:
+                return
+            try:
+                with transaction():
+                    for fn, args in self._pending:
+                        fn(*args)
+            except VersionConflict:
+                self._pending.clear()
+                self._entries.clear()
+                raise
+            self._pending.clear()
+            self.flushes += 1
+
+    def _flush_periodically(self) -> None:
+        while True:
+            time.sleep(self.write_behind)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Was not able to write queued account changes due to {e}; will retry")
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "cached": len(self._entries),
+                "pending_writes": len(self._pending),
+                "flushes": self.flushes,
+            }
@@ -1,41 +1,175 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, PrivateAttr, field_serializer, field_validator
+from typing import Literal
+import functools
 import json
+import os
+import random
+import threading
+import time
 from dotenv import load_dotenv
-from datetime import datetime
-from market import get_share_price
-from database import write_account, read_account, write_log
+from datetime import datetime, timedelta
+from market import get_share_price, get_share_prices
+import async_database
+from account_cache import AccountCache
+from ledger import Ledger, Transaction
+from database import (
+    write_account, read_account, write_account_details, write_trade, write_trades, write_portfolio_value, write_log,
+    VersionConflict, transaction, write_order, read_orders, update_order, read_account_version,
+)
 
 load_dotenv(override=True)
 
 INITIAL_BALANCE = 10_000.0
 SPREAD = 0.002
+# How many of the most recent transactions report() includes; list_transactions() returns them all
+REPORT_RECENT_TRANSACTIONS = int(os.getenv("REPORT_RECENT_TRANSACTIONS", "20"))
+# An unchanged account reuses its last report for this long, so bursts of reads price it only once
+REPORT_CACHE_SECONDS = float(os.getenv("REPORT_CACHE_SECONDS", "10"))
+# mark_to_market() records at most one portfolio value sample per account in this interval
+MARK_TO_MARKET_INTERVAL_SECONDS = float(os.getenv("MARK_TO_MARKET_INTERVAL_SECONDS", "300"))
 
+# How many times an operation is re-run optimistically on a fresh copy when another writer changed the
+# account first; after that it runs once more holding the database write lock, so it cannot conflict
+ACCOUNT_CONFLICT_RETRIES = int(os.getenv("ACCOUNT_CONFLICT_RETRIES", "3"))
+# How many times that last attempt lets go of the lock to fetch prices it did not know it needed
+PINNED_PRICE_ROUNDS = 3
 
-class Transaction(BaseModel):
+_cache = AccountCache()
+# Operations re-run after a version conflict, for the stress test and monitoring
+conflict_retries = 0
+
+
+def _locked(method):
+    """ Serialize calls that read or change an account, since cached accounts are shared between threads. """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def _retry_on_conflict(method=None, *, symbols=None):
+    """
+    Re-run an operation on a freshly loaded copy of the account when its write finds that another
+    process or thread changed the account since it was read. Apply inside _locked. symbols, called
+    with the operation's arguments, names the symbols it trades, whose prices are fetched up front
+    along with the holdings' for the last attempt.
+    """
+    if method is None:
+        return functools.partial(_retry_on_conflict, symbols=symbols)
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        global conflict_retries
+        for attempt in range(ACCOUNT_CONFLICT_RETRIES + 1):
+            try:
+                return method(self, *args, **kwargs)
+            except VersionConflict:
+                conflict_retries += 1
+                time.sleep(random.uniform(0, 0.005 * 2 ** attempt))
+                self._refresh()
+        # Still contended: hold the write lock from the re-read through the write. Prices are fetched
+        # before the lock is taken, since a rate-limited lookup could keep every writer waiting for minutes;
+        # if the operation turns out to need others, the lock is let go while they are fetched.
+        self._refresh()
+        needed, prices = set(self.holdings) | set(symbols(*args, **kwargs) if symbols else ()), {}
+        for _ in range(PINNED_PRICE_ROUNDS):
+            prices.update(self._prices(needed - prices.keys()))
+            self._held_logs = []
+            try:
+                with transaction():
+                    self._refresh()
+                    self._pinned_prices = prices
+                    try:
+                        result = method(self, *args, **kwargs)
+                    finally:
+                        self._pinned_prices = None
+            except _PricesNeeded as e:
+                needed |= e.symbols
+                continue
+            finally:
+                logs, self._held_logs = self._held_logs, None
+            # Logged only once the write has committed, so a round that was rolled back leaves no entries
+            for message in logs:
+                self._log(message)
+            return result
+        raise RuntimeError(f"{method.__name__} for {self.name} kept needing prices it had not fetched")
+    return wrapper
+
+
+class _PricesNeeded(Exception):
+    """ Raised when an operation run under the write lock asks for prices that were not fetched beforehand. """
+
+    def __init__(self, symbols):
+        super().__init__(f"Prices needed for {', '.join(sorted(symbols))}")
+        self.symbols = set(symbols)
+
+
+class Order(BaseModel):
+    """ One leg of a basket order. """
     symbol: str
+    side: Literal["buy", "sell"]
     quantity: int
-    price: float
-    timestamp: str
-    rationale: str
+    rationale: str = ""
+
+
+class RestingOrder(Order):
+    """ An order that waits until the price reaches trigger_price: a limit order fills at that price or
+    better (a buy at or below it, a sell at or above it); a stop order fills once the price moves through
+    it (a buy at or above it, a sell at or below it). """
+    order_type: Literal["limit", "stop"]
+    trigger_price: float
 
-    def total(self) -> float:
-        return self.quantity * self.price
-    
-    def __repr__(self):
-        return f"{abs(self.quantity)} shares of {self.symbol} at {self.price} each."
+
+def _order_symbols(orders, *args, **kwargs) -> list[str]:
+    return [order.symbol if isinstance(order, Order) else order["symbol"] for order in orders]
 
 
 class Account(BaseModel):
     name: str
     balance: float
     strategy: str
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
     holdings: dict[str, int]
-    transactions: list[Transaction]
+    # Array-backed history; behaves like a list of Transactions (see ledger.py)
+    transactions: Ledger
     portfolio_value_time_series: list[tuple[str, float]]
+    # Running aggregates, updated as each trade is made rather than recomputed from the history
+    net_invested: float = 0.0
+    realized_pnl: float = 0.0
+    realized_pnl_fifo: float = 0.0
+    cost_basis: dict[str, float] = {}
+    lots: dict[str, list[tuple[int, float]]] = {}
+    # The stored version this copy was read at; every successful write moves it on by one
+    version: int = 0
+    _lock: threading.RLock = PrivateAttr(default_factory=threading.RLock)
+    # The last report and when it was made; cleared whenever the account changes
+    _report: tuple[str, float] | None = PrivateAttr(default=None)
+    # Prices fetched before taking the database write lock, which lookups must use while it is held
+    _pinned_prices: dict[str, float] | None = PrivateAttr(default=None)
+    # Log messages held back during the write lock's attempt, and written once it commits
+    _held_logs: list[str] | None = PrivateAttr(default=None)
+    # The (id, price) of the resting order being filled, which is marked filled along with its trades
+    _filling: tuple[int, float] | None = PrivateAttr(default=None)
+
+    @field_validator("transactions", mode="before")
+    @classmethod
+    def _to_ledger(cls, transactions):
+        return transactions if isinstance(transactions, Ledger) else Ledger.from_transactions(transactions)
+
+    @field_serializer("transactions")
+    def _from_ledger(self, transactions: Ledger) -> list[dict]:
+        return transactions.to_dicts()
 
     @classmethod
     def get(cls, name: str):
-        fields = read_account(name.lower())
+        """ Return the account, from the in-process cache when it holds the stored version. """
+        return _cache.get(name.lower(), cls._load, read_account_version)
+
+    @classmethod
+    def _load(cls, name: str):
+        fields = read_account(name.lower(), compact=True)
         if not fields:
             fields = {
                 "name": name.lower(),
@@ -43,42 +177,196 @@ class Account(BaseModel):
                 "strategy": "",
                 "holdings": {},
                 "transactions": [],
-                "portfolio_value_time_series": []
+                "portfolio_value_time_series": [],
+                # Zeroed aggregates, so a new account is not mistaken for one saved before they existed
+                "net_invested": 0.0,
+                "realized_pnl": 0.0,
+                "realized_pnl_fifo": 0.0,
+                "cost_basis": {},
+                "lots": {},
             }
-            write_account(name, fields)
-        return cls(**fields)
-    
-    
-    def save(self):
-        write_account(self.name.lower(), self.model_dump())
+            try:
+                write_account(name, fields, expected_version=0, event="create")
+                fields["version"] = 1
+            except VersionConflict:
+                # Another process created it first
+                fields = read_account(name.lower(), compact=True)
+        # Accounts saved before the running aggregates existed have them rebuilt once from their history
+        needs_rebuild = fields.get("net_invested") is None
+        account = cls._from_fields(fields)
+        if needs_rebuild:
+            account.rebuild_aggregates()
+            account._save_aggregates()
+        return account
+
+    @classmethod
+    def _from_fields(cls, fields: dict):
+        if fields["transactions"] and not isinstance(fields["transactions"][0], dict):
+            fields["transactions"] = Ledger.from_rows(fields["transactions"])
+        return cls(**{key: value for key, value in fields.items() if value is not None})
+
+    @classmethod
+    def at(cls, name: str, timestamp: str):
+        """
+        The account as it stood at a "%Y-%m-%d %H:%M:%S" timestamp, rebuilt from its event log.
+        The copy is for reading only: it is not cached and must not be traded on.
+        """
+        fields = read_account(name.lower(), compact=True, at=timestamp)
+        if not fields:
+            raise ValueError(f"No account {name} at {timestamp}")
+        needs_rebuild = fields.get("net_invested") is None
+        account = cls._from_fields(fields)
+        if needs_rebuild:
+            account.rebuild_aggregates()
+        return account
+
+    @classmethod
+    async def aget(cls, name: str):
+        """ Async version of get() that loads the account on a database worker thread. """
+        return await async_database.run(cls.get, name)
+
+    @classmethod
+    def invalidate(cls, name: str | None = None):
+        """ Forget the cached copy of an account (or of all accounts) so the next get() reads the database. """
+        _cache.invalidate(name)
+
+    @staticmethod
+    def cache_stats() -> dict:
+        """ Hit/miss counters and pending write-behind work for the account cache. """
+        return _cache.stats()
+
+    # Hooks for where prices, the time and persistence come from; backtest.BacktestAccount replaces them
+
+    def _write(self, fn, *args):
+        _cache.write(fn, *args)
 
+    def _log(self, message: str):
+        if self._held_logs is not None:
+            self._held_logs.append(message)
+            return
+        write_log(self.name, "account", message)
+
+    def _price(self, symbol: str) -> float:
+        if self._pinned_prices is not None:
+            return self._pinned([symbol])[symbol]
+        return get_share_price(symbol)
+
+    def _prices(self, symbols) -> dict[str, float]:
+        if self._pinned_prices is not None:
+            return self._pinned(symbols)
+        return get_share_prices(symbols)
+
+    def _pinned(self, symbols) -> dict[str, float]:
+        symbols = list(symbols)
+        missing = [symbol for symbol in symbols if symbol not in self._pinned_prices]
+        if missing:
+            raise _PricesNeeded(missing)
+        return {symbol: self._pinned_prices[symbol] for symbol in symbols}
+
+    def _now(self) -> datetime:
+        return datetime.now()
+
+    def _refresh(self):
+        """ Replace this copy's state with the stored account, discarding unsaved changes. """
+        fresh = type(self)._load(self.name)
+        for field in type(self).model_fields:
+            setattr(self, field, getattr(fresh, field))
+        self._report = None
+
+    @_locked
+    def save(self, event: str = "save"):
+        """
+        Store the whole account as a new starting point of its event log; incremental changes use
+        the _save_* helpers below, which append small events.
+        Raises VersionConflict if the stored account changed since this copy was read.
+        """
+        self._report = None
+        # Handing over the Ledger rather than dumping it means only trades not yet stored are built. It is a
+        # snapshot, since a write-behind save runs later, and trades made by then are saved by their own events.
+        account_dict = {**self.model_dump(exclude={"transactions"}), "transactions": self.transactions.snapshot()}
+        self._write(write_account, self.name.lower(), account_dict, self.version, event)
+        self.version += 1
+
+    def _save_details(self, event: str, amount: float | None = None):
+        self._report = None
+        self._write(write_account_details, self.name, self.balance, self.strategy, self.version, event, amount)
+        self.version += 1
+
+    def _totals(self) -> dict:
+        return {
+            "net_invested": self.net_invested,
+            "realized_pnl": self.realized_pnl,
+            "realized_pnl_fifo": self.realized_pnl_fifo,
+        }
+
+    def _position(self, symbol: str) -> tuple[int, float, list]:
+        return self.holdings.get(symbol, 0), self.cost_basis.get(symbol, 0.0), list(self.lots.get(symbol, []))
+
+    def _save_trade(self, transaction: Transaction):
+        self._report = None
+        symbol = transaction.symbol
+        self._write(
+            write_trade, self.name, self.balance, symbol, self.holdings.get(symbol, 0), transaction.model_dump(),
+            self._totals(), *self._position(symbol)[1:], self.version,
+        )
+        self.version += 1
+
+    def _save_trades(self, transactions: list[Transaction]):
+        self._report = None
+        positions = {t.symbol: self._position(t.symbol) for t in transactions}
+        self._write(
+            write_trades, self.name, self.balance, [t.model_dump() for t in transactions], positions, self._totals(),
+            self.version, "trade", self._filling,
+        )
+        self.version += 1
+
+    def _save_aggregates(self):
+        """ Record the running totals and every position's cost basis after rebuild_aggregates(). """
+        self._report = None
+        positions = {symbol: self._position(symbol) for symbol in self.holdings}
+        self._write(write_trades, self.name, self.balance, [], positions, self._totals(), self.version, "rebuild")
+        self.version += 1
+
+    def _save_portfolio_value(self, timestamp: str, value: float):
+        self._report = None
+        self._write(write_portfolio_value, self.name, timestamp, value)
+
+    @_locked
+    @_retry_on_conflict
     def reset(self, strategy: str):
         self.balance = INITIAL_BALANCE
         self.strategy = strategy
         self.holdings = {}
-        self.transactions = []
+        self.transactions = Ledger()
         self.portfolio_value_time_series = []
-        self.save()
+        self.rebuild_aggregates()
+        self.save("reset")
 
+    @_locked
+    @_retry_on_conflict
     def deposit(self, amount: float):
         """ Deposit funds into the account. """
         if amount <= 0:
             raise ValueError("Deposit amount must be positive.")
         self.balance += amount
         print(f"Deposited ${amount}. New balance: ${self.balance}")
-        self.save()
+        self._save_details("deposit", amount)
 
+    @_locked
+    @_retry_on_conflict
     def withdraw(self, amount: float):
         """ Withdraw funds from the account, ensuring it doesn't go negative. """
         if amount > self.balance:
             raise ValueError("Insufficient funds for withdrawal.")
         self.balance -= amount
         print(f"Withdrew ${amount}. New balance: ${self.balance}")
-        self.save()
+        self._save_details("withdraw", amount)
 
+    @_locked
+    @_retry_on_conflict(symbols=lambda symbol, *args, **kwargs: [symbol])
     def buy_shares(self, symbol: str, quantity: int, rationale: str) -> str:
         """ Buy shares of a stock if sufficient funds are available. """
-        price = get_share_price(symbol)
+        price = self._price(symbol)
         buy_price = price * (1 + SPREAD)
         total_cost = buy_price * quantity
         
@@ -87,56 +375,224 @@ class Account(BaseModel):
         elif price==0:
             raise ValueError(f"Unrecognized symbol {symbol}")
         
+        held_before = self.holdings.get(symbol, 0)
         # Update holdings
-        self.holdings[symbol] = self.holdings.get(symbol, 0) + quantity
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.holdings[symbol] = held_before + quantity
+        timestamp = self._now().strftime("%Y-%m-%d %H:%M:%S")
         # Record transaction
         transaction = Transaction(symbol=symbol, quantity=quantity, price=buy_price, timestamp=timestamp, rationale=rationale)
         self.transactions.append(transaction)
+        self._apply_to_aggregates(transaction.symbol, transaction.quantity, transaction.price, held_before)
         
         # Update balance
         self.balance -= total_cost
-        self.save()
-        write_log(self.name, "account", f"Bought {quantity} of {symbol}")
-        return "Completed. Latest details:\n" + self.report()
+        self._save_trade(transaction)
+        self._log(f"Bought {quantity} of {symbol}")
+        return self._completed()
 
+    @_locked
+    @_retry_on_conflict(symbols=lambda symbol, *args, **kwargs: [symbol])
     def sell_shares(self, symbol: str, quantity: int, rationale: str) -> str:
         """ Sell shares of a stock if the user has enough shares. """
         if self.holdings.get(symbol, 0) < quantity:
             raise ValueError(f"Cannot sell {quantity} shares of {symbol}. Not enough shares held.")
         
-        price = get_share_price(symbol)
+        price = self._price(symbol)
         sell_price = price * (1 - SPREAD)
         total_proceeds = sell_price * quantity
         
+        held_before = self.holdings[symbol]
         # Update holdings
         self.holdings[symbol] -= quantity
         
         # If shares are completely sold, remove from holdings
         if self.holdings[symbol] == 0:
             del self.holdings[symbol]
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        timestamp = self._now().strftime("%Y-%m-%d %H:%M:%S")
         # Record transaction
         transaction = Transaction(symbol=symbol, quantity=-quantity, price=sell_price, timestamp=timestamp, rationale=rationale)  # negative quantity for sell
         self.transactions.append(transaction)
+        self._apply_to_aggregates(transaction.symbol, transaction.quantity, transaction.price, held_before)
 
         # Update balance
         self.balance += total_proceeds
-        self.save()
-        write_log(self.name, "account", f"Sold {quantity} of {symbol}")
-        return "Completed. Latest details:\n" + self.report()
+        self._save_trade(transaction)
+        self._log(f"Sold {quantity} of {symbol}")
+        return self._completed()
+
+    @_locked
+    @_retry_on_conflict(symbols=_order_symbols)
+    def execute_basket(self, orders: list[Order], rationale: str = "", prices: dict[str, float] | None = None) -> str:
+        """
+        Execute several orders against one price snapshot, all or nothing, and persist them together.
+        Sells are applied before buys, so the proceeds of a rebalance can fund its purchases.
+        A snapshot already fetched by the caller can be passed as prices.
+        """
+        orders = [order if isinstance(order, Order) else Order(**order) for order in orders]
+        if not orders:
+            raise ValueError("A basket needs at least one order.")
+        prices = prices if prices is not None else self._prices(order.symbol for order in orders)
+        orders = sorted(orders, key=lambda order: order.side != "sell")
+
+        # Check every order against the running cash and holdings before changing anything
+        balance = self.balance
+        holdings = dict(self.holdings)
+        for order in orders:
+            price = prices[order.symbol]
+            if order.quantity <= 0:
+                raise ValueError(f"Order quantity for {order.symbol} must be positive.")
+            if price == 0:
+                raise ValueError(f"Unrecognized symbol {order.symbol}")
+            if order.side == "sell":
+                if holdings.get(order.symbol, 0) < order.quantity:
+                    raise ValueError(f"Cannot sell {order.quantity} shares of {order.symbol}. Not enough shares held.")
+                holdings[order.symbol] -= order.quantity
+                balance += price * (1 - SPREAD) * order.quantity
+            else:
+                balance -= price * (1 + SPREAD) * order.quantity
+                if balance < 0:
+                    raise ValueError(f"Insufficient funds to buy {order.quantity} shares of {order.symbol} in this basket.")
+                holdings[order.symbol] = holdings.get(order.symbol, 0) + order.quantity
+
+        timestamp = self._now().strftime("%Y-%m-%d %H:%M:%S")
+        transactions = []
+        for order in orders:
+            held_before = self.holdings.get(order.symbol, 0)
+            if order.side == "sell":
+                quantity, price = -order.quantity, prices[order.symbol] * (1 - SPREAD)
+            else:
+                quantity, price = order.quantity, prices[order.symbol] * (1 + SPREAD)
+            transaction = Transaction(
+                symbol=order.symbol, quantity=quantity, price=price, timestamp=timestamp,
+                rationale=order.rationale or rationale,
+            )
+            self.holdings[order.symbol] = held_before + quantity
+            if self.holdings[order.symbol] == 0:
+                del self.holdings[order.symbol]
+            self.transactions.append(transaction)
+            self._apply_to_aggregates(transaction.symbol, transaction.quantity, transaction.price, held_before)
+            self.balance -= transaction.total()
+            transactions.append(transaction)
+
+        self._save_trades(transactions)
+        summary = ", ".join(f"{'Bought' if t.quantity > 0 else 'Sold'} {abs(t.quantity)} of {t.symbol}" for t in transactions)
+        self._log(f"Basket: {summary}")
+        return self._completed()
+
+    def _completed(self) -> str:
+        """
+        The result of a trade that has been booked. Valuing the account afterwards prices every holding,
+        which can fail; the trade stands, so the failure is logged and reported rather than raised,
+        which would make the caller think the trade had not happened and try it again.
+        """
+        try:
+            self.mark_to_market()
+            return "Completed. Latest details:\n" + self.report()
+        except _PricesNeeded:
+            # Still inside the write lock's final attempt, which re-runs the trade with the missing prices
+            raise
+        except Exception as e:
+            print(f"Was not able to value account {self.name} after a trade due to {e}")
+            return f"Completed. Latest details are not available right now: {e}"
+
+    @_locked
+    def place_order(self, symbol: str, side: str, quantity: int, order_type: str, trigger_price: float,
+                    rationale: str) -> str:
+        """ Rest a limit or stop order until order_matching.match_orders() finds its trigger price reached. """
+        order = RestingOrder(
+            symbol=symbol, side=side, quantity=quantity, order_type=order_type, trigger_price=trigger_price,
+            rationale=rationale,
+        )
+        if order.quantity <= 0:
+            raise ValueError("Order quantity must be positive.")
+        if order.trigger_price <= 0:
+            raise ValueError("Trigger price must be positive.")
+        if order.side == "sell" and self.holdings.get(symbol, 0) < quantity:
+            raise ValueError(f"Cannot sell {quantity} shares of {symbol}. Not enough shares held.")
+        order_id = write_order(self.name, order.model_dump())
+        self._report = None
+        self._log(f"Placed {order_type} order {order_id} to {side} {quantity} of {symbol} at {trigger_price}")
+        return f"Placed {order_type} order {order_id} to {side} {quantity} of {symbol} at {trigger_price}"
+
+    @_locked
+    def cancel_order(self, order_id: int) -> str:
+        """ Cancel one of this account's open orders. """
+        if not update_order(order_id, "cancelled", name=self.name):
+            raise ValueError(f"No open order {order_id} for {self.name}")
+        self._report = None
+        self._log(f"Cancelled order {order_id}")
+        return f"Cancelled order {order_id}"
+
+    def list_orders(self, status: str = "open") -> list[dict]:
+        """ This account's orders with the given status, oldest first. """
+        return read_orders(self.name, status)
+
+    @_locked
+    def fill_order(self, order: RestingOrder, price: float, order_id: int | None = None) -> str:
+        """
+        Execute a triggered resting order at the matching pass's price. With order_id, the order must
+        be claimed for filling, and is marked filled in the same write as its trade.
+        """
+        self._filling = (order_id, price) if order_id is not None else None
+        try:
+            return self.execute_basket([order], order.rationale, prices={order.symbol: price})
+        finally:
+            self._filling = None
 
     def calculate_portfolio_value(self):
         """ Calculate the total value of the user's portfolio. """
-        total_value = self.balance
-        for symbol, quantity in self.holdings.items():
-            total_value += get_share_price(symbol) * quantity
-        return total_value
+        # One batched lookup for every position rather than a request per holding
+        prices = self._prices(self.holdings.keys())
+        return self.balance + sum(prices[symbol] * quantity for symbol, quantity in self.holdings.items())
 
     def calculate_profit_loss(self, portfolio_value: float):
         """ Calculate profit or loss from the initial spend. """
-        initial_spend = sum(transaction.total() for transaction in self.transactions)
-        return portfolio_value - initial_spend - self.balance
+        return portfolio_value - self.net_invested - self.balance
+
+    def _apply_to_aggregates(self, symbol: str, quantity: int, price: float, held_before: int):
+        """ Fold one trade into the running totals; O(1) apart from the FIFO lots a sale closes. """
+        self.net_invested += quantity * price
+        if quantity > 0:
+            self.cost_basis[symbol] = self.cost_basis.get(symbol, 0.0) + quantity * price
+            self.lots.setdefault(symbol, []).append((quantity, price))
+            return
+
+        sold = -quantity
+        average_cost = self.cost_basis.get(symbol, 0.0) / held_before if held_before else 0.0
+        self.realized_pnl += sold * (price - average_cost)
+        if held_before > sold:
+            self.cost_basis[symbol] -= sold * average_cost
+        else:
+            self.cost_basis.pop(symbol, None)
+
+        lots = self.lots.get(symbol, [])
+        while sold and lots:
+            lot_quantity, lot_price = lots[0]
+            used = min(sold, lot_quantity)
+            self.realized_pnl_fifo += used * (price - lot_price)
+            sold -= used
+            if used == lot_quantity:
+                lots.pop(0)
+            else:
+                lots[0] = (lot_quantity - used, lot_price)
+        # Shares with no recorded purchase have no cost to set against the proceeds
+        self.realized_pnl_fifo += sold * price
+        if not lots:
+            self.lots.pop(symbol, None)
+
+    def rebuild_aggregates(self):
+        """ Recompute the running totals by replaying the whole transaction history. """
+        self.net_invested = self.realized_pnl = self.realized_pnl_fifo = 0.0
+        self.cost_basis = {}
+        self.lots = {}
+        held = {}
+        for symbol, quantity, price in self.transactions.trades():
+            self._apply_to_aggregates(symbol, quantity, price, held.get(symbol, 0))
+            held[symbol] = held.get(symbol, 0) + quantity
+
+    def fifo_cost_basis(self) -> dict[str, float]:
+        """ The cost of each open position under FIFO lot accounting. """
+        return {symbol: sum(quantity * price for quantity, price in lots) for symbol, lots in self.lots.items()}
 
     def get_holdings(self):
         """ Report the current holdings of the user. """
@@ -144,34 +600,62 @@ class Account(BaseModel):
 
     def get_profit_loss(self):
         """ Report the user's profit or loss at any point in time. """
-        return self.calculate_profit_loss()
+        return self.calculate_profit_loss(self.calculate_portfolio_value())
 
     def list_transactions(self):
         """ List all transactions made by the user. """
-        return [transaction.model_dump() for transaction in self.transactions]
+        return self.transactions.to_dicts()
     
+    @_locked
     def report(self) -> str:
-        """ Return a json string representing the account.  """
+        """ Return a json string representing the account. Reading it writes nothing. """
+        if self._report and time.monotonic() - self._report[1] < REPORT_CACHE_SECONDS:
+            return self._report[0]
         portfolio_value = self.calculate_portfolio_value()
-        self.portfolio_value_time_series.append((datetime.now().strftime("%Y-%m-%d %H:%M:%S"), portfolio_value))
-        self.save()
         pnl = self.calculate_profit_loss(portfolio_value)
-        data = self.model_dump()
+        # Only the recent transactions, so the report stays the same size however long the history
+        data = self.model_dump(exclude={"transactions", "lots", "version"})
+        data["transactions"] = [t.model_dump() for t in self.transactions[-REPORT_RECENT_TRANSACTIONS:]]
+        data["cost_basis_fifo"] = self.fifo_cost_basis()
+        data["open_orders"] = [
+            {key: order[key] for key in ("id", "symbol", "side", "quantity", "order_type", "trigger_price")}
+            for order in self.list_orders()
+        ]
         data["total_portfolio_value"] = portfolio_value
         data["total_profit_loss"] = pnl
-        write_log(self.name, "account", f"Retrieved account details")
-        return json.dumps(data)
-    
+        report = json.dumps(data)
+        self._report = (report, time.monotonic())
+        return report
+
+    @_locked
+    def mark_to_market(self, min_interval: float = MARK_TO_MARKET_INTERVAL_SECONDS) -> float | None:
+        """
+        Record the current portfolio value in the time series, unless a sample was already
+        taken within min_interval seconds. Returns the value recorded, or None if skipped.
+        """
+        now = self._now()
+        cutoff = (now - timedelta(seconds=min_interval)).strftime("%Y-%m-%d %H:%M:%S")
+        if self.portfolio_value_time_series and self.portfolio_value_time_series[-1][0] > cutoff:
+            return None
+        portfolio_value = self.calculate_portfolio_value()
+        timestamp = now.strftime("%Y-%m-%d %H:%M:%S")
+        self.portfolio_value_time_series.append((timestamp, portfolio_value))
+        self._save_portfolio_value(timestamp, portfolio_value)
+        self._log(f"Marked to market at {portfolio_value:.2f}")
+        return portfolio_value
+
     def get_strategy(self) -> str:
         """ Return the strategy of the account """
-        write_log(self.name, "account", f"Retrieved strategy")
+        self._log(f"Retrieved strategy")
         return self.strategy
     
+    @_locked
+    @_retry_on_conflict
     def change_strategy(self, strategy: str) -> str:
         """ At your discretion, if you choose to, call this to change your investment strategy for the future """
         self.strategy = strategy
-        self.save()
-        write_log(self.name, "account", f"Changed strategy")
+        self._save_details("strategy")
+        self._log(f"Changed strategy")
         return "Changed strategy"
 
 # Example of usage:
@@ -0,0 +1,166 @@
+import asyncio
+import json
+from collections import defaultdict
+from mcp.server.fastmcp import FastMCP
+from accounts import Account, Order
+from async_database import run
+from analytics import get_metrics, get_rolling_metrics
+from datetime import date
+
+mcp = FastMCP("accounts_server")
+
+# Account operations read and write SQLite (and buy/sell also fetch a price), so every tool
+# hands that blocking work to the database worker threads. The event loop stays free to
+# accept the agent's next call while earlier ones are still waiting on disk.
+# Calls that change an account still queue behind each other, one account at a time, so two
+# trades on the same account never read the same starting state.
+
+_account_locks: dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+
+async def run_for_account(name: str, fn):
+    """Run a blocking account operation on the worker threads, after any earlier one on the same account."""
+    async with _account_locks[name.lower()]:
+        return await run(fn)
+
+
+@mcp.tool()
+async def get_balance(name: str) -> float:
+    """Get the cash balance of the given account name.
+
+    Args:
+        name: The name of the account holder
+    """
+    return (await Account.aget(name)).balance
+
+
+@mcp.tool()
+async def get_current_date() -> str:
+    """Return the current date in ISO format (YYYY-MM-DD)."""
+    return date.today().isoformat()
+
+
+@mcp.tool()
+async def get_holdings(name: str) -> dict[str, int]:
+    """Get the holdings of the given account name.
+
+    Args:
+        name: The name of the account holder
+    """
+    return (await Account.aget(name)).holdings
+
+
+@mcp.tool()
+async def buy_shares(name: str, symbol: str, quantity: int, rationale: str) -> str:
+    """Buy shares of a stock.
+
+    Args:
+        name: The name of the account holder
+        symbol: The symbol of the stock
+        quantity: The quantity of shares to buy
+        rationale: The rationale for the purchase and fit with the account's strategy
+    """
+    return await run_for_account(name, lambda: Account.get(name).buy_shares(symbol, quantity, rationale))
+
+
+@mcp.tool()
+async def sell_shares(name: str, symbol: str, quantity: int, rationale: str) -> str:
+    """Sell shares of a stock.
+
+    Args:
+        name: The name of the account holder
+        symbol: The symbol of the stock
+        quantity: The quantity of shares to sell
+        rationale: The rationale for the sale and fit with the account's strategy
+    """
+    return await run_for_account(name, lambda: Account.get(name).sell_shares(symbol, quantity, rationale))
+
+
+@mcp.tool()
+async def execute_basket(name: str, orders: list[Order], rationale: str) -> str:
+    """Buy and sell several stocks in one step, all at the same prices. Either every order is
+    executed or, if any one cannot be (unknown symbol, not enough cash or shares), none are.
+    Sells are applied first, so their proceeds can pay for the buys. Prefer this to several
+    separate buy_shares and sell_shares calls.
+
+    Args:
+        name: The name of the account holder
+        orders: The orders, each with symbol, side ("buy" or "sell"), quantity and an optional rationale
+        rationale: The rationale for the basket as a whole and its fit with the account's strategy
+    """
+    return await run_for_account(name, lambda: Account.get(name).execute_basket(orders, rationale))
+
+
+@mcp.tool()
+async def place_order(name: str, symbol: str, side: str, quantity: int, order_type: str, trigger_price: float,
+                      rationale: str) -> str:
+    """Place a resting order that executes automatically once the price reaches trigger_price, so you
+    don't need to keep checking the price. A "limit" order buys at or below / sells at or above the
+    trigger price; a "stop" order buys once the price rises to / sells once it falls to the trigger price.
+    Orders stay open until they execute or you cancel them.
+
+    Args:
+        name: The name of the account holder
+        symbol: The symbol of the stock
+        side: "buy" or "sell"
+        quantity: The quantity of shares
+        order_type: "limit" or "stop"
+        trigger_price: The price at which the order executes
+        rationale: The rationale for the order and fit with the account's strategy
+    """
+    return await run_for_account(name, lambda: Account.get(name).place_order(symbol, side, quantity, order_type, trigger_price, rationale))
+
+
+@mcp.tool()
+async def cancel_order(name: str, order_id: int) -> str:
+    """Cancel one of your open limit or stop orders.
+
+    Args:
+        name: The name of the account holder
+        order_id: The id of the order, as returned when it was placed
+    """
+    return await run_for_account(name, lambda: Account.get(name).cancel_order(order_id))
+
+
+@mcp.tool()
+async def list_orders(name: str) -> list[dict]:
+    """List your open limit and stop orders.
+
+    Args:
+        name: The name of the account holder
+    """
+    return await run(lambda: Account.get(name).list_orders())
+
+
+@mcp.tool()
+async def change_strategy(name: str, strategy: str) -> str:
+    """At your discretion, if you choose to, call this to change your investment strategy for the future.
+
+    Args:
+        name: The name of the account holder
+        strategy: The new strategy for the account
+    """
+    return await run_for_account(name, lambda: Account.get(name).change_strategy(strategy))
+
+
+@mcp.resource("accounts://accounts_server/{name}")
+async def read_account_resource(name: str) -> str:
+    return await run(lambda: Account.get(name.lower()).report())
+
+
+@mcp.resource("accounts://strategy/{name}")
+async def read_strategy_resource(name: str) -> str:
+    return await run(lambda: Account.get(name.lower()).get_strategy())
+
+
+@mcp.resource("accounts://analytics/{name}")
+async def read_analytics_resource(name: str) -> str:
+    def analytics():
+        rolling = get_rolling_metrics(name)
+        latest = {key: values[-1] for key, values in rolling.items() if values}
+        return json.dumps({**get_metrics(name), "rolling": latest})
+    return await run(analytics)
+
+
+if __name__ == "__main__":
+    mcp.run(transport="stdio")
@@ -0,0 +1,219 @@
+"""
+Portfolio analytics for every trader: returns, volatility, Sharpe and Sortino ratios,
+maximum drawdown and rolling metrics, computed with NumPy from the portfolio value rollups.
+
+Each account's bucketed values are cached along with running sums of its returns, its
+peak value and its worst drawdown so far. A refresh reads only the buckets added since the
+last one, for all accounts in a single query, and folds them into those sums. The newest
+bucket is still filling up, so it is counted afresh on every refresh rather than folded in.
+If an account's oldest stored bucket has changed, because it was reset or its old buckets
+were pruned, its sums are started again from what is stored. The metrics for all accounts
+are then computed together as arrays.
+"""
+
+import os
+import threading
+from itertools import groupby
+import numpy as np
+from dotenv import load_dotenv
+from database import (
+    PORTFOLIO_VALUE_RESOLUTIONS, read_portfolio_value_buckets, read_first_portfolio_value_buckets, read_account_names,
+)
+
+load_dotenv(override=True)
+
+# Which rollup the metrics are computed from: "1m", "1h" or "1d"
+ANALYTICS_RESOLUTION = os.getenv("ANALYTICS_RESOLUTION", "1h")
+# Annual risk-free rate subtracted from returns in the Sharpe and Sortino ratios
+RISK_FREE_RATE = float(os.getenv("RISK_FREE_RATE", "0.0"))
+# Number of buckets in each window of the rolling metrics
+ANALYTICS_ROLLING_WINDOW = int(os.getenv("ANALYTICS_ROLLING_WINDOW", "24"))
+
+if ANALYTICS_RESOLUTION not in PORTFOLIO_VALUE_RESOLUTIONS:
+    raise ValueError(f"Invalid ANALYTICS_RESOLUTION {ANALYTICS_RESOLUTION}")
+
+SECONDS_PER_YEAR = 365.25 * 86400
+
+
+def _finite(value) -> float | None:
+    # JSON has no NaN or infinity; undefined metrics (too few samples, no variance) are reported as None
+    return float(value) if np.isfinite(value) else None
+
+
+def _epochs(buckets) -> np.ndarray:
+    return np.array(buckets, dtype="datetime64[s]").astype(np.int64)
+
+
+class _Series:
+    """The closed buckets of one account, with running totals over their returns."""
+
+    __slots__ = ("first_bucket", "last_bucket", "times", "values", "count", "total", "total_squares", "downside_squares",
+                 "peak", "max_drawdown", "open_times", "open_values")
+
+    def __init__(self, first_bucket: str = ""):
+        # The oldest stored bucket these totals start from; they are only valid while it is still there
+        self.first_bucket = first_bucket
+        self.last_bucket = ""
+        self.times = np.empty(0, dtype=np.int64)
+        self.values = np.empty(0, dtype=np.float64)
+        self.count = 0
+        self.total = self.total_squares = self.downside_squares = 0.0
+        self.peak = -np.inf
+        self.max_drawdown = 0.0
+        # The bucket still being filled, kept apart from the running totals
+        self.open_times = np.empty(0, dtype=np.int64)
+        self.open_values = np.empty(0, dtype=np.float64)
+
+    def update(self, buckets: list[str], closes: list[float]) -> None:
+        """Fold in buckets from last_bucket onwards; every one but the newest is closed."""
+        # last_bucket was the open bucket last time; it is re-read with its final value
+        closed = buckets[:-1]
+        self.open_times, self.open_values = _epochs(buckets[-1:]), np.array(closes[-1:], dtype=np.float64)
+        if not closed:
+            return
+        totals = _accumulate(self._state(), self.values[-1:], np.array(closes[:-1], dtype=np.float64))
+        self.count, self.total, self.total_squares, self.downside_squares, self.peak, self.max_drawdown = totals
+        self.times = np.concatenate([self.times, _epochs(closed)])
+        self.values = np.concatenate([self.values, closes[:-1]])
+        self.last_bucket = buckets[-1]
+
+    def _state(self) -> tuple:
+        return self.count, self.total, self.total_squares, self.downside_squares, self.peak, self.max_drawdown
+
+    def current(self) -> tuple:
+        """The running totals with the open bucket counted as well."""
+        return _accumulate(self._state(), self.values[-1:], self.open_values)
+
+    def all_times(self) -> np.ndarray:
+        return np.concatenate([self.times, self.open_times])
+
+    def all_values(self) -> np.ndarray:
+        return np.concatenate([self.values, self.open_values])
+
+
+def _accumulate(state: tuple, previous: np.ndarray, values: np.ndarray) -> tuple:
+    """Add new values, following the previous one (if any), to (count, sum, sum of squares, downside, peak, drawdown)."""
+    count, total, total_squares, downside_squares, peak, max_drawdown = state
+    if not len(values):
+        return state
+    series = np.concatenate([previous, values])
+    returns = series[1:] / series[:-1] - 1
+    running_peak = np.maximum.accumulate(np.concatenate([[peak], values]))[1:]
+    drawdowns = values / running_peak - 1
+    return (
+        count + len(returns),
+        total + returns.sum(),
+        total_squares + (returns ** 2).sum(),
+        downside_squares + (np.minimum(returns, 0) ** 2).sum(),
+        running_peak[-1],
+        min(max_drawdown, drawdowns.min()),
+    )
+
+
+def _metrics(names: list[str], series: list[_Series], risk_free_rate: float) -> dict[str, dict]:
+    """Compute the metrics of many accounts at once from their running totals."""
+    totals = np.array([s.current() for s in series], dtype=np.float64).reshape(-1, 6)
+    count, total, total_squares, downside_squares, _, max_drawdown = totals.T
+    values = [s.all_values() for s in series]
+    times = [s.all_times() for s in series]
+    samples = [len(v) for v in values]
+    first = np.array([v[0] if len(v) else np.nan for v in values])
+    last = np.array([v[-1] if len(v) else np.nan for v in values])
+    start = np.array([t[0] if len(t) else 0 for t in times], dtype=np.float64)
+    end = np.array([t[-1] if len(t) else 0 for t in times], dtype=np.float64)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # Samples are irregular (only while the trading floor runs), so annualize by their average spacing
+        periods_per_year = SECONDS_PER_YEAR * count / (end - start)
+        mean = total / count
+        std = np.sqrt(np.maximum(total_squares - count * mean ** 2, 0) / (count - 1))
+        downside = np.sqrt(downside_squares / count)
+        excess = mean - risk_free_rate / periods_per_year
+        results = {
+            "total_return": last / first - 1,
+            "mean_return": mean,
+            "volatility": std * np.sqrt(periods_per_year),
+            "sharpe_ratio": excess / std * np.sqrt(periods_per_year),
+            "sortino_ratio": excess / downside * np.sqrt(periods_per_year),
+            "max_drawdown": max_drawdown,
+        }
+    return {
+        name: {"samples": int(samples[i]), **{key: _finite(column[i]) for key, column in results.items()}}
+        for i, name in enumerate(names)
+    }
+
+
+class PortfolioAnalytics:
+    """Per-account cache of portfolio value buckets and return statistics, refreshed incrementally."""
+
+    def __init__(self, resolution: str = ANALYTICS_RESOLUTION, risk_free_rate: float = RISK_FREE_RATE):
+        self.resolution = resolution
+        self.risk_free_rate = risk_free_rate
+        self._series: dict[str, _Series] = {}
+        self._lock = threading.Lock()
+
+    def refresh(self, names: list[str]) -> None:
+        """Read the buckets added since the last refresh for all the given accounts in one query."""
+        with self._lock:
+            first = read_first_portfolio_value_buckets(names, self.resolution)
+            for name in names:
+                if name not in self._series or self._series[name].first_bucket != first.get(name, ""):
+                    self._series[name] = _Series(first.get(name, ""))
+            series = {name: self._series[name] for name in names}
+            since = min(s.last_bucket for s in series.values())
+            rows = read_portfolio_value_buckets(names, self.resolution, since)
+            for name, group in groupby(rows, key=lambda row: row[0]):
+                s = series[name]
+                group = [row for row in group if row[1] >= s.last_bucket]
+                if group:
+                    s.update([row[1] for row in group], [row[2] for row in group])
+
+    def metrics(self, names: list[str] | None = None) -> dict[str, dict]:
+        """Refresh and return the metrics of the given accounts, or of every account."""
+        names = [name.lower() for name in names] if names is not None else read_account_names()
+        if not names:
+            return {}
+        self.refresh(names)
+        with self._lock:
+            return _metrics(names, [self._series[name] for name in names], self.risk_free_rate)
+
+    def rolling(self, name: str, window: int = ANALYTICS_ROLLING_WINDOW) -> dict[str, list]:
+        """
+        Rolling return and annualized volatility over each window of `window` buckets.
+        Returns the end time of each window with its values, oldest first.
+        """
+        name = name.lower()
+        self.refresh([name])
+        with self._lock:
+            times, values = self._series[name].all_times(), self._series[name].all_values()
+        if len(values) <= window:
+            return {"datetime": [], "return": [], "volatility": []}
+        returns = values[1:] / values[:-1] - 1
+        windows = np.lib.stride_tricks.sliding_window_view(returns, window)
+        spacing = (times[window:] - times[:-window]) / window
+        with np.errstate(divide="ignore", invalid="ignore"):
+            volatility = windows.std(axis=1, ddof=1) * np.sqrt(SECONDS_PER_YEAR / spacing)
+        ends = times[window:].astype("datetime64[s]").astype(str)
+        return {
+            "datetime": [end.replace("T", " ") for end in ends],
+            "return": (values[window:] / values[:-window] - 1).tolist(),
+            "volatility": [_finite(v) for v in volatility],
+        }
+
+
+_analytics = PortfolioAnalytics()
+
+
+def get_all_metrics() -> dict[str, dict]:
+    """Metrics for every account, keyed by name."""
+    return _analytics.metrics()
+
+
+def get_metrics(name: str) -> dict:
+    """Metrics for one account: total and mean return, volatility, Sharpe, Sortino and max drawdown."""
+    return _analytics.metrics([name])[name.lower()]
+
+
+def get_rolling_metrics(name: str, window: int = ANALYTICS_ROLLING_WINDOW) -> dict[str, list]:
+    """Rolling return and volatility for one account."""
+    return _analytics.rolling(name, window)
@@ -0,0 +1,25 @@
+"""
+Runs blocking database work for callers on an event loop, such as the accounts MCP server.
+
+sqlite3 is blocking, so each call is handed to a small pool of dedicated worker threads.
+Every worker keeps its own long-lived WAL connection from database.get_connection(), which
+lets concurrent reads overlap while SQLite serializes the writes.
+"""
+
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+
+DB_WORKER_THREADS = int(os.getenv("DB_WORKER_THREADS", "4"))
+
+_executor = ThreadPoolExecutor(max_workers=DB_WORKER_THREADS, thread_name_prefix="db-worker")
+
+
+async def run(fn, *args, **kwargs):
+    """Run a blocking, database-bound callable on the database worker threads and await its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(fn, *args, **kwargs))
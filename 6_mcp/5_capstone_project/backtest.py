@@ -0,0 +1,268 @@
+"""
+Offline backtests of trading strategies against the stored market snapshots.
+
+A BacktestAccount is an Account that lives only in memory. Its prices come from a MarketReplay
+bound to the simulated date and its timestamps from the simulated clock. Nothing is written to
+the database or the logs, and there are no Polygon calls. A simulated day is a few array
+lookups plus the strategy's own trades, so a run over a year of snapshots takes well under a
+second, and many strategies or parameter sets run side by side in separate processes.
+
+A strategy is a function called once per simulated day as strategy(account, replay, **params).
+It trades through the normal Account methods (buy_shares, sell_shares, execute_basket).
+
+Run from this directory, for example:
+
+    uv run backtest.py --start 2025-01-01 --end 2025-06-30 --strategy momentum --param lookback=5,20 --param top=3,5
+"""
+
+import argparse
+import inspect
+import itertools
+import json
+import math
+import multiprocessing
+import time
+from datetime import datetime
+import numpy as np
+from pydantic import PrivateAttr
+from accounts import Account, INITIAL_BALANCE, SPREAD
+from database import read_market_history
+from ledger import Ledger
+
+# Simulated trades and valuations happen at the close
+CLOSE_TIME = "16:00:00"
+
+
+class MarketReplay:
+    """
+    The stored snapshots for a range of dates as a dates x symbols array of closes, with a
+    simulated clock that steps through the dates. A symbol with no close on a date keeps its
+    last known close.
+    """
+
+    def __init__(self, start: str, end: str, symbols: list[str] | None = None):
+        rows = read_market_history(start, end, symbols)
+        self.dates = sorted({date for date, _, _ in rows})
+        self.symbols = sorted({symbol for _, symbol, _ in rows})
+        self._columns = {symbol: i for i, symbol in enumerate(self.symbols)}
+        date_index = {date: i for i, date in enumerate(self.dates)}
+        closes = np.full((len(self.dates), len(self.symbols)), np.nan)
+        for date, symbol, close in rows:
+            closes[date_index[date], self._columns[symbol]] = close
+        # Forward-fill each column from its last known close
+        filled = np.where(np.isnan(closes), 0, np.arange(len(self.dates))[:, None])
+        np.maximum.accumulate(filled, axis=0, out=filled)
+        self.closes = closes[filled, np.arange(len(self.symbols))]
+        self.set_day(0)
+
+    def set_day(self, day: int) -> None:
+        self.day = day
+        self._now = datetime.fromisoformat(f"{self.today} {CLOSE_TIME}") if self.dates else None
+
+    @property
+    def today(self) -> str:
+        return self.dates[self.day]
+
+    def now(self) -> datetime:
+        return self._now
+
+    def price(self, symbol: str) -> float:
+        column = self._columns.get(symbol)
+        close = self.closes[self.day, column] if column is not None else math.nan
+        return 0.0 if math.isnan(close) else float(close)
+
+    def prices(self, symbols) -> dict[str, float]:
+        return {symbol: self.price(symbol) for symbol in symbols}
+
+    def history(self, days: int) -> np.ndarray:
+        """The closes of the last `days` dates up to and including today, one row per date."""
+        return self.closes[max(0, self.day - days + 1):self.day + 1]
+
+
+class BacktestAccount(Account):
+    """An account that exists only in memory, priced and timed by a MarketReplay."""
+
+    _replay: MarketReplay = PrivateAttr(default=None)
+
+    @classmethod
+    def create(cls, name: str, replay: MarketReplay, balance: float = INITIAL_BALANCE, strategy: str = ""):
+        account = cls(
+            name=name, balance=balance, strategy=strategy, holdings={}, transactions=Ledger(),
+            portfolio_value_time_series=[],
+        )
+        account._replay = replay
+        return account
+
+    def _write(self, fn, *args):
+        pass
+
+    def _log(self, message: str):
+        pass
+
+    def _price(self, symbol: str) -> float:
+        return self._replay.price(symbol)
+
+    def _prices(self, symbols) -> dict[str, float]:
+        return self._replay.prices(symbols)
+
+    def _now(self) -> datetime:
+        return self._replay.now()
+
+    def report(self) -> str:
+        """ A short summary; the full report, with its whole value history, is not needed offline. """
+        portfolio_value = self.calculate_portfolio_value()
+        return json.dumps({
+            "date": self._replay.today,
+            "balance": self.balance,
+            "holdings": self.holdings,
+            "total_portfolio_value": portfolio_value,
+            "total_profit_loss": self.calculate_profit_loss(portfolio_value),
+        })
+
+    def begin_day(self) -> None:
+        # A cached report holds the previous day's prices
+        self._report = None
+
+
+def buy_and_hold(account: BacktestAccount, replay: MarketReplay) -> None:
+    """Spend the cash equally across the universe on the first day and hold."""
+    if account.holdings or replay.day:
+        return
+    universe = [s for s in replay.symbols if replay.price(s) > 0]
+    budget = account.balance / len(universe) if universe else 0
+    orders = [
+        {"symbol": s, "side": "buy", "quantity": int(budget // (replay.price(s) * (1 + SPREAD)))} for s in universe
+    ]
+    orders = [order for order in orders if order["quantity"] > 0]
+    if orders:
+        account.execute_basket(orders, "Buy and hold")
+
+
+def momentum(account: BacktestAccount, replay: MarketReplay, lookback: int = 20, top: int = 5, every: int = 5) -> None:
+    """Every `every` days, hold the `top` symbols with the best return over the last `lookback` days, equally weighted."""
+    if replay.day < lookback or (replay.day - lookback) % every:
+        return
+    history = replay.history(lookback + 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        returns = history[-1] / history[0] - 1
+    returns = np.where(np.isfinite(returns), returns, -np.inf)
+    winners = [replay.symbols[i] for i in np.argsort(-returns, kind="stable")[:top] if np.isfinite(returns[i])]
+    prices = replay.prices(set(winners) | set(account.holdings))
+    value = account.balance + sum(prices[s] * q for s, q in account.holdings.items())
+    # Leave room for the spread so the buys always fit in the cash the sells raise
+    target = {s: int(value * 0.99 / len(winners) // (prices[s] * (1 + SPREAD))) for s in winners} if winners else {}
+    orders = []
+    for symbol in set(account.holdings) | set(target):
+        change = target.get(symbol, 0) - account.holdings.get(symbol, 0)
+        if change:
+            orders.append({"symbol": symbol, "side": "buy" if change > 0 else "sell", "quantity": abs(change)})
+    if orders:
+        account.execute_basket(sorted(orders, key=lambda order: order["symbol"]), f"Momentum over {lookback} days")
+
+
+STRATEGIES = {
+    "buy_and_hold": buy_and_hold,
+    "momentum": momentum,
+}
+
+# Each worker process loads a date range once and reuses it for every configuration it runs
+_replays: dict[tuple, MarketReplay] = {}
+
+
+def run_backtest(config: dict) -> dict:
+    """
+    Run one strategy over a date range and summarize it.
+
+    Args:
+        config (dict): strategy, params, start, end, and optionally symbols and balance
+
+    Returns:
+        dict: The config with final_value, total_return, max_drawdown, trades, days and seconds
+    """
+    symbols = config.get("symbols")
+    key = (config["start"], config["end"], tuple(symbols) if symbols else None)
+    if key not in _replays:
+        _replays[key] = MarketReplay(config["start"], config["end"], symbols)
+    replay = _replays[key]
+    strategy = STRATEGIES[config["strategy"]]
+    params = config.get("params", {})
+    account = BacktestAccount.create("backtest", replay, config.get("balance", INITIAL_BALANCE), config["strategy"])
+
+    start = time.perf_counter()
+    for day in range(len(replay.dates)):
+        replay.set_day(day)
+        account.begin_day()
+        strategy(account, replay, **params)
+        account.mark_to_market(0)
+    seconds = time.perf_counter() - start
+
+    values = np.array([value for _, value in account.portfolio_value_time_series])
+    initial = config.get("balance", INITIAL_BALANCE)
+    return {
+        **config,
+        "final_value": float(values[-1]) if len(values) else initial,
+        "total_return": float(values[-1] / initial - 1) if len(values) else 0.0,
+        "max_drawdown": float((values / np.maximum.accumulate(values) - 1).min()) if len(values) else 0.0,
+        "trades": len(account.transactions),
+        "days": len(replay.dates),
+        "seconds": seconds,
+    }
+
+
+def run_many(configs: list[dict], processes: int | None = None) -> list[dict]:
+    """Run the configurations across worker processes and report throughput in simulated days per second."""
+    start = time.perf_counter()
+    with multiprocessing.get_context("spawn").Pool(processes) as pool:
+        results = pool.map(run_backtest, configs)
+    elapsed = time.perf_counter() - start
+    days = sum(result["days"] for result in results)
+    simulated = sum(result["seconds"] for result in results)
+    print(f"{'strategy':<14} {'params':<32} {'return':>9} {'drawdown':>9} {'trades':>7}")
+    for result in results:
+        params = ", ".join(f"{k}={v}" for k, v in result.get("params", {}).items())
+        print(
+            f"{result['strategy']:<14} {params:<32} {result['total_return']:>9.2%} "
+            f"{result['max_drawdown']:>9.2%} {result['trades']:>7}"
+        )
+    print(
+        f"\n{len(results)} backtests, {days} simulated days in {elapsed:.2f}s: "
+        f"{days / elapsed:,.0f} days/sec overall, {days / simulated:,.0f} days/sec per process once loaded"
+    )
+    return results
+
+
+def _parse_value(text: str):
+    for kind in (int, float):
+        try:
+            return kind(text)
+        except ValueError:
+            pass
+    return text
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--start", required=True, help="first snapshot date, YYYY-MM-DD")
+    parser.add_argument("--end", required=True, help="last snapshot date, YYYY-MM-DD")
+    parser.add_argument("--strategy", action="append", choices=sorted(STRATEGIES), help="strategy to run (repeatable)")
+    parser.add_argument("--param", action="append", default=[], help="name=v1,v2,... ; every combination is run")
+    parser.add_argument("--symbols", help="comma-separated universe; default is every stored symbol")
+    parser.add_argument("--balance", type=float, default=INITIAL_BALANCE)
+    parser.add_argument("--processes", type=int, default=None, help="worker processes; default one per CPU")
+    args = parser.parse_args()
+
+    grid = {name: [_parse_value(v) for v in values.split(",")] for name, values in (p.split("=", 1) for p in args.param)}
+    configs = []
+    for strategy in args.strategy or ["buy_and_hold"]:
+        accepted = inspect.signature(STRATEGIES[strategy]).parameters
+        names = [name for name in grid if name in accepted]
+        for combination in itertools.product(*(grid[name] for name in names)):
+            configs.append({
+                "strategy": strategy,
+                "params": dict(zip(names, combination)),
+                "start": args.start,
+                "end": args.end,
+                "symbols": args.symbols.split(",") if args.symbols else None,
+                "balance": args.balance,
+            })
+    run_many(configs, args.processes)
@@ -0,0 +1,167 @@
+"""
+Consistent snapshots of accounts.db taken while the trading floor is running, and restores.
+
+snapshot copies the live database into a standalone SQLite file. It reads inside one read
+transaction, which in WAL mode sees a single consistent point in time without blocking any
+writer. Only the snapshot file is written. Re-running snapshot against an existing file is
+incremental for the tables database.py marks as append-only (logs, transactions, the account
+event log and portfolio values), which copy only rows with new keys and drop rows that were
+pruned, and for market_prices, which copies only new dates. Mutable tables, and any table
+database.py does not classify, are copied in full.
+
+restore copies a snapshot file over a database with SQLite's online backup API, a batch of
+pages at a time. Use it on a database nothing else is writing to, such as a test environment.
+
+Run from this directory, for example:
+
+    uv run backup.py snapshot backups/accounts-snapshot.db
+    uv run backup.py restore backups/accounts-snapshot.db --to test_accounts.db
+"""
+
+import argparse
+import os
+import sqlite3
+import time
+from database import DB, connect, APPEND_ONLY_TABLES, DATE_KEYED_TABLES
+
+CHUNK_ROWS = 50_000
+PAGES_PER_STEP = 1024
+
+
+def _tables(conn: sqlite3.Connection, schema: str) -> dict[str, str]:
+    return dict(conn.execute(
+        f"SELECT name, sql FROM {schema}.sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+    ).fetchall())
+
+
+def _copy_range(conn: sqlite3.Connection, table: str, after_id: int) -> int:
+    """Copy main rows with id > after_id into the snapshot in chunks, so progress can be reported."""
+    copied = 0
+    last_id = conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM main.{table}").fetchone()[0]
+    while after_id < last_id:
+        upper = after_id + CHUNK_ROWS
+        copied += conn.execute(
+            f"INSERT INTO snap.{table} SELECT * FROM main.{table} WHERE id > ? AND id <= ?", (after_id, upper)
+        ).rowcount
+        after_id = upper
+    return copied
+
+
+def _sync_appended(conn: sqlite3.Connection, table: str, key: tuple[str, ...]) -> int:
+    """Drop the rows the source has pruned and copy the ones it has gained, matching rows by key."""
+    def missing_from(schema: str) -> str:
+        match = " AND ".join(f"other.{column} = row.{column}" for column in key)
+        return f"NOT EXISTS (SELECT 1 FROM {schema}.{table} AS other WHERE {match})"
+
+    if key != ("id",):
+        conn.execute(f"DELETE FROM snap.{table} AS row WHERE {missing_from('main')}")
+        return conn.execute(f"INSERT INTO snap.{table} SELECT * FROM main.{table} AS row WHERE {missing_from('snap')}").rowcount
+    # Ids only grow, so the new rows are those past the snapshot's last id. Pruning mostly removes the
+    # oldest rows, which go by range; only if the counts still differ are the others probed for by key.
+    first_id = conn.execute(f"SELECT MIN(id) FROM main.{table}").fetchone()[0]
+    if first_id is None:
+        conn.execute(f"DELETE FROM snap.{table}")
+        return 0
+    conn.execute(f"DELETE FROM snap.{table} WHERE id < ?", (first_id,))
+    after_id = conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM snap.{table}").fetchone()[0]
+    count = f"SELECT COUNT(*) FROM {{}}.{table} WHERE id <= ?"
+    if conn.execute(count.format("snap"), (after_id,)).fetchone() != conn.execute(count.format("main"), (after_id,)).fetchone():
+        conn.execute(f"DELETE FROM snap.{table} AS row WHERE {missing_from('main')}")
+    return _copy_range(conn, table, after_id)
+
+
+def _sync_table(conn: sqlite3.Connection, table: str) -> int:
+    if table in APPEND_ONLY_TABLES:
+        return _sync_appended(conn, table, APPEND_ONLY_TABLES[table])
+    if table in DATE_KEYED_TABLES:
+        key = DATE_KEYED_TABLES[table]
+        latest = conn.execute(f"SELECT COALESCE(MAX({key}), '') FROM snap.{table}").fetchone()[0]
+        conn.execute(f"DELETE FROM snap.{table} WHERE {key} >= ?", (latest,))
+        return conn.execute(f"INSERT INTO snap.{table} SELECT * FROM main.{table} WHERE {key} >= ?", (latest,)).rowcount
+    conn.execute(f"DELETE FROM snap.{table}")
+    return conn.execute(f"INSERT INTO snap.{table} SELECT * FROM main.{table}").rowcount
+
+
+def snapshot(dest: str, source: str = DB) -> None:
+    """
+    Write a consistent copy of the source database to dest, updating dest incrementally if it
+    is an earlier snapshot.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(dest)), exist_ok=True)
+    start = time.perf_counter()
+    conn = connect(source)
+    try:
+        conn.execute("ATTACH DATABASE ? AS snap", (dest,))
+        # One transaction: the reads of main share a single WAL snapshot, the writes only lock snap
+        conn.execute("BEGIN")
+        source_tables = _tables(conn, "main")
+        snap_tables = _tables(conn, "snap")
+        for table in snap_tables.keys() - source_tables.keys():
+            conn.execute(f"DROP TABLE snap.{table}")
+        copied = 0
+        for table, sql in source_tables.items():
+            if snap_tables.get(table) != sql:
+                # New table, or its schema changed since the last snapshot: start it from scratch
+                conn.execute(f"DROP TABLE IF EXISTS snap.{table}")
+                conn.execute(sql.replace("CREATE TABLE ", "CREATE TABLE snap.", 1))
+            table_start = time.perf_counter()
+            rows = _sync_table(conn, table)
+            copied += rows
+            print(f"{table:<24} {rows:>10} rows in {time.perf_counter() - table_start:6.2f}s")
+        for (sql,) in conn.execute(
+            "SELECT sql FROM main.sqlite_master WHERE type = 'index' AND sql IS NOT NULL"
+        ).fetchall():
+            conn.execute(sql.replace("CREATE INDEX ", "CREATE INDEX IF NOT EXISTS snap.", 1))
+        if conn.execute("SELECT 1 FROM snap.sqlite_master WHERE name = 'sqlite_sequence'").fetchone():
+            conn.execute("DELETE FROM snap.sqlite_sequence")
+            conn.execute("INSERT INTO snap.sqlite_sequence SELECT * FROM main.sqlite_sequence")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    elapsed = time.perf_counter() - start
+    size = os.path.getsize(dest) / 1e6
+    print(f"Snapshot {dest}: {copied} rows copied in {elapsed:.2f}s ({copied / elapsed:,.0f} rows/sec, {size:.1f} MB)")
+
+
+def restore(snapshot_path: str, dest: str = DB) -> None:
+    """Copy a snapshot over dest with the online backup API, PAGES_PER_STEP pages at a time."""
+    if not os.path.exists(snapshot_path):
+        raise FileNotFoundError(snapshot_path)
+    start = time.perf_counter()
+    source = sqlite3.connect(snapshot_path)
+    target = connect(dest)
+
+    def progress(status, remaining, total):
+        done = total - remaining
+        print(f"\rRestored {done}/{total} pages", end="", flush=True)
+
+    try:
+        source.backup(target, pages=PAGES_PER_STEP, progress=progress)
+    finally:
+        pages = target.execute("PRAGMA page_count").fetchone()[0]
+        page_size = target.execute("PRAGMA page_size").fetchone()[0]
+        source.close()
+        target.close()
+    elapsed = time.perf_counter() - start
+    megabytes = pages * page_size / 1e6
+    print(f"\nRestored {snapshot_path} to {dest}: {megabytes:.1f} MB in {elapsed:.2f}s ({megabytes / elapsed:.1f} MB/sec)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    snapshot_parser = commands.add_parser("snapshot", help="write or update a consistent snapshot file")
+    snapshot_parser.add_argument("dest")
+    snapshot_parser.add_argument("--from", dest="source", default=DB, help="database to snapshot")
+    restore_parser = commands.add_parser("restore", help="copy a snapshot over a database")
+    restore_parser.add_argument("snapshot")
+    restore_parser.add_argument("--to", dest="dest", default=DB, help="database to overwrite")
+    args = parser.parse_args()
+
+    if args.command == "snapshot":
+        snapshot(args.dest, args.source)
+    else:
+        restore(args.snapshot, args.dest)
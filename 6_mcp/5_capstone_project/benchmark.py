@@ -0,0 +1,205 @@
+"""
+Micro-benchmarks for the trading floor's persistence layer.
+
+Each benchmark runs against a throwaway database in a temporary directory, so it is safe
+to run next to a live accounts.db. Run from this directory, for example:
+
+    uv run benchmark.py database --ops 2000
+    uv run benchmark.py ledger --ops 100000
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+ACCOUNT = {
+    "name": "bench",
+    "balance": 10_000.0,
+    "strategy": "Buy low, sell high",
+    "holdings": {"AAPL": 10, "MSFT": 5},
+    "transactions": [],
+    "portfolio_value_time_series": [],
+}
+
+
+def report(label: str, ops: int, seconds: float) -> float:
+    rate = ops / seconds
+    print(f"{label:<40} {ops:>8} ops in {seconds:8.3f}s = {rate:>12,.0f} ops/sec")
+    return rate
+
+
+def legacy_database(path: str):
+    """The original database.py access pattern: a fresh connection and a rollback-journal commit per call."""
+
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE IF NOT EXISTS accounts (name TEXT PRIMARY KEY, account TEXT)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS logs (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "name TEXT, datetime DATETIME, type TEXT, message TEXT)"
+        )
+
+    def write_account(name, account_dict):
+        with sqlite3.connect(path) as conn:
+            conn.execute(
+                "INSERT INTO accounts (name, account) VALUES (?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET account=excluded.account",
+                (name.lower(), json.dumps(account_dict)),
+            )
+            conn.commit()
+
+    def read_account(name):
+        with sqlite3.connect(path) as conn:
+            row = conn.execute("SELECT account FROM accounts WHERE name = ?", (name.lower(),)).fetchone()
+            return json.loads(row[0]) if row else None
+
+    def write_log(name, type, message):
+        with sqlite3.connect(path) as conn:
+            conn.execute(
+                "INSERT INTO logs (name, datetime, type, message) VALUES (?, datetime('now'), ?, ?)",
+                (name.lower(), type, message),
+            )
+            conn.commit()
+
+    def read_log(name, last_n=10):
+        with sqlite3.connect(path) as conn:
+            return conn.execute(
+                "SELECT datetime, type, message FROM logs WHERE name = ? ORDER BY datetime DESC LIMIT ?",
+                (name.lower(), last_n),
+            ).fetchall()
+
+    return write_account, read_account, write_log, read_log
+
+
+def run_workload(label: str, write_account, read_account, write_log, read_log, ops: int, flush=None) -> dict:
+    """Time each of the hot database calls a trader run makes, one after another."""
+    results = {}
+    start = time.perf_counter()
+    for _ in range(ops):
+        write_account("bench", ACCOUNT)
+    results["write_account"] = report(f"{label} write_account", ops, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for _ in range(ops):
+        read_account("bench")
+    results["read_account"] = report(f"{label} read_account", ops, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for i in range(ops):
+        write_log("bench", "account", f"Message {i}")
+    if flush:
+        flush()
+    results["write_log"] = report(f"{label} write_log", ops, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for _ in range(ops):
+        list(read_log("bench", 10))
+    results["read_log"] = report(f"{label} read_log", ops, time.perf_counter() - start)
+    return results
+
+
+def bench_database(ops: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        before = run_workload("before:", *legacy_database(os.path.join(tmp, "legacy.db")), ops=ops)
+
+        # database.py opens its tables on import, so point it at the scratch file first
+        os.environ["ACCOUNTS_DB"] = os.path.join(tmp, "pooled.db")
+        import database
+
+        after = run_workload(
+            f"after ({database.SQLITE_SYNCHRONOUS}):",
+            database.write_account,
+            database.read_account,
+            database.write_log,
+            database.read_log,
+            ops=ops,
+            flush=database.flush_logs,
+        )
+        database.close_connections()
+
+    print()
+    for op in before:
+        print(f"{op:<16} speedup x{after[op] / before[op]:.1f}")
+
+
+def _rss_mb() -> float:
+    """Resident set size of this process, from /proc where available, else the peak from getrusage."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except OSError:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1e6 if sys.platform == "darwin" else peak / 1e3
+
+
+def _load_history(path: str, compact: bool) -> tuple[float, float]:
+    """Load the bench account in a fresh process; returns (seconds, MB of RSS the loaded account holds)."""
+    os.environ["ACCOUNTS_DB"] = path
+    import accounts
+    from ledger import Transaction
+
+    before = _rss_mb()
+    start = time.perf_counter()
+    if compact:
+        account = accounts.Account._load("bench")
+    else:
+        # The previous representation: every trade validated into a pydantic Transaction
+        account = [Transaction(**t) for t in accounts.read_account("bench")["transactions"]]
+    elapsed = time.perf_counter() - start
+    held = _rss_mb() - before
+    del account
+    return elapsed, held
+
+
+def bench_ledger(ops: int) -> None:
+    """Load an account with ops trades in its history as Transaction objects and as a Ledger."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "ledger.db")
+        os.environ["ACCOUNTS_DB"] = path
+        import database
+
+        symbols = ["AAPL", "MSFT", "NVDA", "AMZN", "GOOG", "META", "TSLA", "JPM"]
+        database.write_account("bench", {**ACCOUNT, "net_invested": 0.0, "realized_pnl": 0.0, "realized_pnl_fifo": 0.0})
+        rationale = "Buying on the pullback after earnings; the position fits the long-term value strategy. " * 2
+        for start in range(0, ops, 10_000):
+            trades = [
+                {"symbol": symbols[i % len(symbols)], "quantity": 1 + i % 20, "price": 100.0 + i % 50,
+                 "timestamp": "2025-06-02 15:30:00", "rationale": rationale}
+                for i in range(start, min(start + 10_000, ops))
+            ]
+            database.write_trades("bench", ACCOUNT["balance"], trades, {}, {
+                "net_invested": 0.0, "realized_pnl": 0.0, "realized_pnl_fifo": 0.0,
+            })
+        database.close_connections()
+
+        context = multiprocessing.get_context("spawn")
+        results = {}
+        for label, compact in (("before: list[Transaction]", False), ("after: Ledger", True)):
+            with context.Pool(1) as pool:
+                seconds, megabytes = pool.apply(_load_history, (path, compact))
+            results[label] = (seconds, megabytes)
+            print(f"{label:<28} {ops:>8} trades loaded in {seconds:8.3f}s, holding {megabytes:8.1f} MB RSS")
+
+    (before_s, before_mb), (after_s, after_mb) = results.values()
+    print()
+    print(f"load time        speedup x{before_s / after_s:.1f}")
+    print(f"resident memory  saving  x{before_mb / max(after_mb, 0.1):.1f}")
+
+
+BENCHMARKS = {
+    "database": bench_database,
+    "ledger": bench_ledger,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--ops", type=int, default=1000, help="operations per measurement")
+    args = parser.parse_args()
+    sys.exit(BENCHMARKS[args.benchmark](args.ops))
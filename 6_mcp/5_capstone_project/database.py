@@ -1,17 +1,240 @@
 import sqlite3
 import json
-from datetime import datetime
+import os
+import atexit
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
 
 load_dotenv(override=True)
 
-DB = "accounts.db"
+DB = os.getenv("ACCOUNTS_DB", "accounts.db")
 
+# Every thread keeps one long-lived connection in WAL mode instead of connecting per call.
+# SQLITE_SYNCHRONOUS picks the durability/speed trade-off: FULL fsyncs on every commit,
+# NORMAL (the default) only at WAL checkpoints, OFF leaves flushing to the OS.
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL").strip().upper()
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
 
-with sqlite3.connect(DB) as conn:
-    cursor = conn.cursor()
-    cursor.execute('CREATE TABLE IF NOT EXISTS accounts (name TEXT PRIMARY KEY, account TEXT)')
-    cursor.execute('''
+if SQLITE_SYNCHRONOUS not in ("OFF", "NORMAL", "FULL", "EXTRA"):
+    raise ValueError(f"Invalid SQLITE_SYNCHRONOUS level {SQLITE_SYNCHRONOUS}")
+
+# Account changes are appended to an event log. Every ACCOUNT_SNAPSHOT_INTERVAL events the whole state
+# is stored as well, so loading an account replays at most that many events.
+ACCOUNT_SNAPSHOT_INTERVAL = int(os.getenv("ACCOUNT_SNAPSHOT_INTERVAL", "100"))
+
+if ACCOUNT_SNAPSHOT_INTERVAL < 1:
+    raise ValueError(f"Invalid ACCOUNT_SNAPSHOT_INTERVAL {ACCOUNT_SNAPSHOT_INTERVAL}")
+
+# Portfolio values are appended raw and rolled up into per-minute, hourly and daily buckets as they
+# arrive. Each level is pruned after its retention period in days (0 keeps it forever).
+PORTFOLIO_VALUE_RESOLUTIONS = {
+    "1m": ("%Y-%m-%d %H:%M:00", 60),
+    "1h": ("%Y-%m-%d %H:00:00", 3600),
+    "1d": ("%Y-%m-%d 00:00:00", 86400),
+}
+PORTFOLIO_VALUE_RETENTION_DAYS = {
+    "raw": int(os.getenv("PORTFOLIO_RAW_RETENTION_DAYS", "2")),
+    "1m": int(os.getenv("PORTFOLIO_MINUTE_RETENTION_DAYS", "14")),
+    "1h": int(os.getenv("PORTFOLIO_HOURLY_RETENTION_DAYS", "180")),
+    "1d": int(os.getenv("PORTFOLIO_DAILY_RETENTION_DAYS", "0")),
+}
+# The window of portfolio values loaded with an account, and the most points it may hold
+PORTFOLIO_VALUE_WINDOW_DAYS = int(os.getenv("PORTFOLIO_VALUE_WINDOW_DAYS", "30"))
+PORTFOLIO_VALUE_MAX_POINTS = int(os.getenv("PORTFOLIO_VALUE_MAX_POINTS", "1000"))
+PRUNE_INTERVAL_SECONDS = 3600
+
+# Log rows are queued and committed by a background thread in groups of up to LOG_BATCH_SIZE,
+# or after LOG_FLUSH_INTERVAL_SECONDS, whichever comes first
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "500"))
+LOG_FLUSH_INTERVAL_SECONDS = float(os.getenv("LOG_FLUSH_INTERVAL_SECONDS", "0.5"))
+
+_local = threading.local()
+_connections: dict[threading.Thread, sqlite3.Connection] = {}
+_connections_lock = threading.Lock()
+_generation = 0
+
+
+def connect(path: str = DB) -> sqlite3.Connection:
+    """Open a new connection in autocommit mode, configured for WAL and the chosen synchronous level."""
+    conn = sqlite3.connect(
+        path,
+        timeout=SQLITE_BUSY_TIMEOUT_MS / 1000,
+        isolation_level=None,
+        check_same_thread=False,
+    )
+    # Lets new databases hand freed pages back in small steps (see log_maintenance.compact);
+    # it has no effect on a database that already has tables
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    return conn
+
+
+def get_connection() -> sqlite3.Connection:
+    """Return this thread's connection, opening it on first use."""
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.generation != _generation:
+        conn = connect()
+        with _connections_lock:
+            # Close connections left behind by threads that have since exited
+            for thread in [t for t in _connections if not t.is_alive()]:
+                _connections.pop(thread).close()
+            # A handle from before close_connections() is already closed; one opened while it ran is not
+            stale = _connections.pop(threading.current_thread(), None)
+            if stale is not None and stale is not conn:
+                stale.close()
+            # Read the generation under the lock, so a close_connections() racing with this one
+            # either closes the new connection or leaves it current, never half of each
+            _connections[threading.current_thread()] = conn
+            _local.conn, _local.generation = conn, _generation
+    return conn
+
+
+def close_connections() -> None:
+    """
+    Close every pooled connection. Each thread's handle belongs to the generation it was opened in,
+    so other threads notice theirs is closed and reconnect lazily on their next query.
+    """
+    global _generation
+    with _connections_lock:
+        for conn in _connections.values():
+            conn.close()
+        _connections.clear()
+        _generation += 1
+    _local.__dict__.clear()
+
+
+atexit.register(close_connections)
+
+
+class VersionConflict(Exception):
+    """Raised when a write expected an account version that another writer has already replaced."""
+
+
+class OrderClosed(Exception):
+    """Raised when the trades filling a resting order find it no longer claimed for filling."""
+
+
+@contextmanager
+def read_transaction():
+    """
+    Run the enclosed reads against one consistent snapshot of the database.
+    Nested uses join the outermost transaction.
+    """
+    conn = get_connection()
+    if conn.in_transaction:
+        yield conn
+        return
+    conn.execute("BEGIN")
+    try:
+        yield conn
+    finally:
+        conn.commit()
+
+
+@contextmanager
+def transaction():
+    """
+    Run the enclosed statements as one write transaction on this thread's connection.
+    Nested uses join the outermost transaction.
+    """
+    conn = get_connection()
+    if conn.in_transaction:
+        yield conn
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    else:
+        conn.commit()
+
+
+def _add_column(conn: sqlite3.Connection, table: str, column: str, declaration: str) -> None:
+    """Add a column to a table created by an earlier version of this module, if it is missing."""
+    if column not in [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]:
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {declaration}')
+
+
+with transaction() as conn:
+    # Accounts used to be stored as one JSON document each; set that table aside for migration below
+    if "account" in [row[1] for row in conn.execute("PRAGMA table_info(accounts)")]:
+        conn.execute('ALTER TABLE accounts RENAME TO accounts_json')
+    # ...and then as rows of their current state, overwritten in place; likewise set aside
+    if "balance" in [row[1] for row in conn.execute("PRAGMA table_info(accounts)")]:
+        conn.execute('ALTER TABLE accounts RENAME TO accounts_rows')
+    # The names of all accounts; their state lives in the event log below
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS accounts (
+            name TEXT PRIMARY KEY,
+            created TEXT NOT NULL
+        )
+    ''')
+    # Every change to an account, in order. An event's version is the account version it creates, and
+    # the unique key stops two writers from both appending the same next version.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS account_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            type TEXT NOT NULL,
+            timestamp TEXT NOT NULL,
+            data TEXT NOT NULL,
+            UNIQUE (name, version)
+        )
+    ''')
+    # The materialized state of an account at some of its versions, so loading replays only later events
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS account_snapshots (
+            name TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            timestamp TEXT NOT NULL,
+            state TEXT NOT NULL,
+            PRIMARY KEY (name, version)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            symbol TEXT NOT NULL,
+            quantity INTEGER NOT NULL,
+            price REAL NOT NULL,
+            timestamp TEXT NOT NULL,
+            rationale TEXT NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_transactions_name ON transactions (name, id)')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS portfolio_values (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            datetime TEXT NOT NULL,
+            value REAL NOT NULL
+        )
+    ''')
+    conn.execute('DROP INDEX IF EXISTS idx_portfolio_values_name')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_portfolio_values_name_datetime ON portfolio_values (name, datetime)')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS portfolio_value_rollups (
+            name TEXT NOT NULL,
+            resolution TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            open REAL NOT NULL,
+            high REAL NOT NULL,
+            low REAL NOT NULL,
+            close REAL NOT NULL,
+            samples INTEGER NOT NULL,
+            PRIMARY KEY (name, resolution, bucket)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
         CREATE TABLE IF NOT EXISTS logs (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             name TEXT,
@@ -20,82 +243,846 @@ with sqlite3.connect(DB) as conn:
             message TEXT
         )
     ''')
-    cursor.execute('CREATE TABLE IF NOT EXISTS market (date TEXT PRIMARY KEY, data TEXT)')
-    conn.commit()
-
-def write_account(name, account_dict):
-    json_data = json.dumps(account_dict)
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO accounts (name, account)
-            VALUES (?, ?)
-            ON CONFLICT(name) DO UPDATE SET account=excluded.account
-        ''', (name.lower(), json_data))
-        conn.commit()
+    # Tailing a trader's log walks this index backwards from its newest id, however large the table grows
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_logs_name_id ON logs (name, id)')
+    # One row per symbol per trading day, so a price lookup never has to parse a whole day's snapshot
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS market_prices (
+            date TEXT NOT NULL,
+            symbol TEXT NOT NULL,
+            close REAL NOT NULL,
+            PRIMARY KEY (date, symbol)
+        ) WITHOUT ROWID
+    ''')
+    # Resting limit and stop orders; rows move from open to filled, rejected or cancelled
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS orders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            symbol TEXT NOT NULL,
+            side TEXT NOT NULL,
+            quantity INTEGER NOT NULL,
+            order_type TEXT NOT NULL,
+            trigger_price REAL NOT NULL,
+            rationale TEXT NOT NULL DEFAULT '',
+            status TEXT NOT NULL DEFAULT 'open',
+            created TEXT NOT NULL,
+            updated TEXT,
+            fill_price REAL,
+            note TEXT
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_orders_status_name ON orders (status, name)')
+    # The latest price of each symbol as published by the price feed (price_feed.py), with when it was
+    # fetched in epoch seconds, shared by every process that prices shares
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS live_prices (
+            symbol TEXT PRIMARY KEY,
+            price REAL NOT NULL,
+            updated REAL NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    # Symbols some process priced without finding a fresh live price, so the feed starts publishing them
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS watched_symbols (
+            symbol TEXT PRIMARY KEY,
+            requested REAL NOT NULL
+        ) WITHOUT ROWID
+    ''')
+
+# How each table above changes, so backup.py can bring a snapshot of it up to date incrementally.
+# Append-only tables only ever gain rows under new keys, though old rows may be pruned; they map to
+# their primary key. Date-keyed tables only gain new dates. Mutable tables have rows updated in place
+# and are copied in full, as is any table not listed here.
+APPEND_ONLY_TABLES = {
+    "transactions": ("id",),
+    "portfolio_values": ("id",),
+    "logs": ("id",),
+    "account_events": ("id",),
+    "account_snapshots": ("name", "version"),
+}
+DATE_KEYED_TABLES = {"market_prices": "date"}
+MUTABLE_TABLES = {"accounts", "portfolio_value_rollups", "orders", "live_prices", "watched_symbols"}
+
+
+def _insert_transaction(conn: sqlite3.Connection, name: str, transaction: dict) -> int:
+    return conn.execute('''
+        INSERT INTO transactions (name, symbol, quantity, price, timestamp, rationale)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (name, transaction["symbol"], transaction["quantity"], transaction["price"],
+          transaction["timestamp"], transaction["rationale"])).lastrowid
+
+
+# Events that carry an account's whole state; replay starts afresh from them
+FULL_STATE_EVENTS = {"create", "reset", "save", "import"}
+# The state fields other events may set directly
+STATE_FIELDS = ("balance", "strategy", "net_invested", "realized_pnl", "realized_pnl_fifo", "last_transaction")
+
+
+def _apply_event(state: dict | None, type: str, data: dict) -> dict | None:
+    """
+    Fold one event into an account's state. The state holds balance, strategy, holdings, cost_basis,
+    lots, the P&L totals, and the range of transaction ids (first_transaction, last_transaction] that
+    make up its history.
+    """
+    if type in FULL_STATE_EVENTS:
+        return data
+    if state is None:
+        return None
+    state.update({key: data[key] for key in STATE_FIELDS if key in data})
+    for symbol, (quantity, cost_basis, lots) in data.get("positions", {}).items():
+        if quantity:
+            state["holdings"][symbol] = quantity
+            state["cost_basis"][symbol] = cost_basis
+            state["lots"][symbol] = lots or []
+        else:
+            for field in ("holdings", "cost_basis", "lots"):
+                state[field].pop(symbol, None)
+    return state
+
+
+def _replay(conn: sqlite3.Connection, name: str, at: str | None = None) -> tuple[dict | None, int]:
+    """
+    Rebuild an account's state from its latest snapshot and the events after it, as of the
+    timestamp `at` (None for now). Returns the state, or None if there was no account, and its version.
+    """
+    until, params = ('AND timestamp <= ?', (at,)) if at else ('', ())
+    row = conn.execute(f'''
+        SELECT version, state FROM account_snapshots WHERE name = ? {until} ORDER BY version DESC LIMIT 1
+    ''', (name, *params)).fetchone()
+    version, state = (row[0], json.loads(row[1])) if row else (0, None)
+    for version, type, data in conn.execute(f'''
+        SELECT version, type, data FROM account_events WHERE name = ? AND version > ? {until} ORDER BY version
+    ''', (name, version, *params)):
+        state = _apply_event(state, type, json.loads(data))
+    return state, version
+
+
+def _append_event(conn: sqlite3.Connection, name: str, type: str, data: dict, expected_version: int | None) -> None:
+    """
+    Append an event to an account's log, if the account is still at expected_version (None skips the
+    check), and snapshot its state when the event carries all of it or completes an interval.
+    Events other than full-state ones are ignored for an account that does not exist.
+    """
+    version = conn.execute('SELECT COALESCE(MAX(version), 0) FROM account_events WHERE name = ?', (name,)).fetchone()[0]
+    if expected_version is not None and version != expected_version:
+        raise VersionConflict(f"Account {name} has changed since version {expected_version}")
+    if not version and type not in FULL_STATE_EVENTS:
+        return
+    version += 1
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    conn.execute(
+        'INSERT INTO account_events (name, version, type, timestamp, data) VALUES (?, ?, ?, ?, ?)',
+        (name, version, type, now, json.dumps(data)),
+    )
+    if type in FULL_STATE_EVENTS:
+        conn.execute('INSERT OR IGNORE INTO accounts (name, created) VALUES (?, ?)', (name, now))
+    elif version % ACCOUNT_SNAPSHOT_INTERVAL == 0:
+        data, _ = _replay(conn, name)
+    else:
+        return
+    conn.execute(
+        'INSERT INTO account_snapshots (name, version, timestamp, state) VALUES (?, ?, ?, ?)',
+        (name, version, now, json.dumps(data)),
+    )
+
+def write_account(name, account_dict, expected_version: int | None = None, event: str = "save"):
+    """
+    Store a whole account as a new starting point of its event log: its history becomes the
+    transactions in account_dict (on a plain save, the stored ones keep their ids). Used when
+    creating, resetting or importing accounts; day-to-day changes go through write_account_details,
+    write_trade and write_portfolio_value. Accounts without P&L aggregates (from before they
+    existed) are stored with null totals. Earlier events and transactions are kept for
+    read_account(at=...).
+
+    Only a create or reset replaces the stored portfolio values and rollups; an import adds its
+    values to them, and any other event leaves them alone, since account_dict only carries the
+    downsampled window that read_account loads.
+
+    With expected_version, the write only happens if the stored account is still at that version
+    (a missing account counts as version 0); otherwise VersionConflict is raised.
+    """
+    name = name.lower()
+    cost_basis = account_dict.get("cost_basis", {})
+    lots = account_dict.get("lots", {})
+    with transaction() as conn:
+        stored, _ = _replay(conn, name) if event == "save" else (None, 0)
+        if stored:
+            # The stored transactions keep their ids; only those made since are added after them
+            first_transaction, last_transaction = stored["first_transaction"], stored["last_transaction"]
+            kept = conn.execute(
+                'SELECT COUNT(*) FROM transactions WHERE name = ? AND id > ? AND id <= ?',
+                (name, first_transaction, last_transaction),
+            ).fetchone()[0]
+        else:
+            first_transaction = conn.execute('SELECT COALESCE(MAX(id), 0) FROM transactions').fetchone()[0]
+            last_transaction, kept = first_transaction, 0
+        # Either dicts or, from Account.save, the Ledger itself, which only builds the slice taken here
+        for transaction_dict in account_dict["transactions"][kept:]:
+            last_transaction = _insert_transaction(conn, name, dict(transaction_dict))
+        holdings = {symbol: quantity for symbol, quantity in account_dict["holdings"].items() if quantity}
+        state = {
+            "balance": account_dict["balance"],
+            "strategy": account_dict["strategy"],
+            "holdings": holdings,
+            "cost_basis": {symbol: cost_basis.get(symbol, 0.0) for symbol in holdings},
+            "lots": {symbol: lots.get(symbol) or [] for symbol in holdings},
+            "net_invested": account_dict.get("net_invested"),
+            "realized_pnl": account_dict.get("realized_pnl"),
+            "realized_pnl_fifo": account_dict.get("realized_pnl_fifo"),
+            "first_transaction": first_transaction,
+            "last_transaction": last_transaction,
+        }
+        _append_event(conn, name, event, state, expected_version)
+        if event in ("create", "reset"):
+            for table in ("portfolio_values", "portfolio_value_rollups"):
+                conn.execute(f'DELETE FROM {table} WHERE name = ?', (name,))
+        if event in ("create", "reset", "import"):
+            for when, value in account_dict["portfolio_value_time_series"]:
+                _append_portfolio_value(conn, name, when, value)
+
+def read_account(name, compact: bool = False, at: str | None = None):
+    """
+    Read an account and its history by replaying its event log from the latest snapshot.
+    With compact=True, "transactions" holds bare (id, symbol, quantity, price, timestamp) rows
+    with no rationale text, for ledger.Ledger. With at, a "%Y-%m-%d %H:%M:%S" timestamp, the account
+    is reconstructed as it stood then, with the portfolio values of the PORTFOLIO_VALUE_WINDOW_DAYS
+    leading up to that time.
+    """
+    name = name.lower()
+    # One snapshot, so the version returned matches every row read with it
+    with read_transaction() as conn:
+        state, version = _replay(conn, name, at)
+        if not state:
+            return None
+        bounds = (name, state["first_transaction"], state["last_transaction"])
+        if compact:
+            transactions = conn.execute('''
+                SELECT id, symbol, quantity, price, timestamp FROM transactions
+                WHERE name = ? AND id > ? AND id <= ? ORDER BY id
+            ''', bounds).fetchall()
+        else:
+            transactions = [
+                {"symbol": symbol, "quantity": quantity, "price": price, "timestamp": timestamp, "rationale": rationale}
+                for symbol, quantity, price, timestamp, rationale in conn.execute('''
+                    SELECT symbol, quantity, price, timestamp, rationale FROM transactions
+                    WHERE name = ? AND id > ? AND id <= ? ORDER BY id
+                ''', bounds)
+            ]
+        # The same window a current read loads, ending at `at`, at the finest resolution still kept for it
+        portfolio_value_time_series = read_portfolio_values(name, days=PORTFOLIO_VALUE_WINDOW_DAYS, until=at)
+    return {
+        "name": name,
+        "balance": state["balance"],
+        "strategy": state["strategy"],
+        "holdings": state["holdings"],
+        "transactions": transactions,
+        "portfolio_value_time_series": portfolio_value_time_series,
+        "net_invested": state["net_invested"],
+        "realized_pnl": state["realized_pnl"],
+        "realized_pnl_fifo": state["realized_pnl_fifo"],
+        "cost_basis": state["cost_basis"],
+        "lots": {symbol: [tuple(lot) for lot in lots] for symbol, lots in state["lots"].items()},
+        "version": version,
+    }
+
+def read_account_version(name: str) -> int:
+    """The stored version of an account (0 if it does not exist), read from one index entry."""
+    return get_connection().execute(
+        'SELECT COALESCE(MAX(version), 0) FROM account_events WHERE name = ?', (name.lower(),)
+    ).fetchone()[0]
+
+def read_account_events(name: str, since_version: int = 0) -> list[dict]:
+    """An account's events after since_version, oldest first, as dicts of version, type, timestamp and data."""
+    cursor = get_connection().execute('''
+        SELECT version, type, timestamp, data FROM account_events WHERE name = ? AND version > ? ORDER BY version
+    ''', (name.lower(), since_version))
+    return [
+        {"version": version, "type": type, "timestamp": timestamp, "data": json.loads(data)}
+        for version, type, timestamp, data in cursor
+    ]
+
+def read_transaction_rationales(ids: list[int]) -> dict[int, str]:
+    """Look up the rationale text of transactions by id."""
+    rationales = {}
+    for i in range(0, len(ids), 500):
+        chunk = ids[i:i + 500]
+        cursor = get_connection().execute(
+            f'SELECT id, rationale FROM transactions WHERE id IN ({",".join("?" * len(chunk))})', chunk
+        )
+        rationales.update(cursor.fetchall())
+    return rationales
+
+def _migrate_accounts_json() -> None:
+    """Copy accounts saved by the JSON-blob schema into the event log, then drop the old table."""
+    with transaction() as conn:
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'accounts_json'").fetchone():
+            return
+        for name, account in conn.execute('SELECT name, account FROM accounts_json').fetchall():
+            if account:
+                write_account(name, json.loads(account), event="import")
+        conn.execute('DROP TABLE accounts_json')
+
+def _migrate_account_rows() -> None:
+    """Start an event log for each account stored as rows of its current state, then drop those tables."""
+    with transaction() as conn:
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'accounts_rows'").fetchone():
+            return
+        # Rows written before the running P&L aggregates existed lack these columns
+        for column in ("net_invested", "realized_pnl", "realized_pnl_fifo"):
+            _add_column(conn, "accounts_rows", column, "REAL")
+        _add_column(conn, "holdings", "cost_basis", "REAL NOT NULL DEFAULT 0")
+        _add_column(conn, "holdings", "lots", "TEXT NOT NULL DEFAULT '[]'")
+        accounts = conn.execute(
+            'SELECT name, balance, strategy, net_invested, realized_pnl, realized_pnl_fifo FROM accounts_rows'
+        ).fetchall()
+        for name, balance, strategy, net_invested, realized_pnl, realized_pnl_fifo in accounts:
+            holdings = conn.execute(
+                'SELECT symbol, quantity, cost_basis, lots FROM holdings WHERE name = ?', (name,)
+            ).fetchall()
+            last_transaction = conn.execute(
+                'SELECT COALESCE(MAX(id), 0) FROM transactions WHERE name = ?', (name,)
+            ).fetchone()[0]
+            _append_event(conn, name, "import", {
+                "balance": balance,
+                "strategy": strategy,
+                "holdings": {symbol: quantity for symbol, quantity, _, _ in holdings},
+                "cost_basis": {symbol: cost_basis for symbol, _, cost_basis, _ in holdings},
+                "lots": {symbol: json.loads(lots) for symbol, _, _, lots in holdings},
+                "net_invested": net_invested,
+                "realized_pnl": realized_pnl,
+                "realized_pnl_fifo": realized_pnl_fifo,
+                "first_transaction": 0,
+                "last_transaction": last_transaction,
+            }, None)
+        conn.execute('DROP TABLE accounts_rows')
+        conn.execute('DROP TABLE holdings')
+
+
+def write_account_details(name: str, balance: float, strategy: str, expected_version: int | None = None,
+                          event: str = "details", amount: float | None = None) -> None:
+    """
+    Record a change of balance or strategy, such as a deposit, withdrawal or new strategy, if the
+    account is still at expected_version.
+    """
+    data = {"balance": balance, "strategy": strategy}
+    if amount is not None:
+        data["amount"] = amount
+    with transaction() as conn:
+        _append_event(conn, name.lower(), event, data, expected_version)
+
+def write_trade(name: str, balance: float, symbol: str, quantity_held: int, transaction_dict: dict,
+                totals: dict, cost_basis: float = 0.0, lots: list | None = None,
+                expected_version: int | None = None) -> None:
+    """
+    Record one trade as a transaction row and an account event in a single transaction.
+
+    Args:
+        name (str): The account name
+        balance (float): The cash balance after the trade
+        symbol (str): The symbol traded
+        quantity_held (int): The number of shares of symbol held after the trade
+        transaction_dict (dict): The transaction to append to the account's history
+        totals (dict): The account's net_invested, realized_pnl and realized_pnl_fifo after the trade
+        cost_basis (float): The average-cost basis of the remaining position in symbol
+        lots (list): The open FIFO lots of symbol as [quantity, price] pairs
+        expected_version (int): Only write if the account is still at this version; None skips the check
+    """
+    write_trades(
+        name, balance, [transaction_dict], {symbol: (quantity_held, cost_basis, lots)}, totals, expected_version
+    )
+
+def write_trades(name: str, balance: float, transaction_dicts: list[dict], positions: dict, totals: dict,
+                 expected_version: int | None = None, event: str = "trade",
+                 filled_order: tuple[int, float] | None = None) -> None:
+    """
+    Record several trades, such as a basket order, as one account event in a single transaction.
+
+    Args:
+        name (str): The account name
+        balance (float): The cash balance after the trades
+        transaction_dicts (list): The transactions to append to the account's history, in order
+        positions (dict): For each symbol traded, its (quantity_held, cost_basis, lots) after the trades
+        totals (dict): The account's net_invested, realized_pnl and realized_pnl_fifo after the trades
+        expected_version (int): Only write if the account is still at this version; None skips the check
+        event (str): The event type to record
+        filled_order (tuple): The (id, fill price) of the resting order these trades fill, if any; it is
+            moved from filling to filled in the same transaction, so a crash cannot book one without the other
+
+    Raises:
+        VersionConflict: If another writer changed the account since expected_version
+        OrderClosed: If filled_order is no longer claimed for filling; nothing is written
+    """
+    name = name.lower()
+    data = {"balance": balance, **totals, "positions": positions}
+    with transaction() as conn:
+        for transaction_dict in transaction_dicts:
+            data["last_transaction"] = _insert_transaction(conn, name, transaction_dict)
+        _append_event(conn, name, event, data, expected_version)
+        if filled_order and not update_order(filled_order[0], "filled", "filling", fill_price=filled_order[1]):
+            raise OrderClosed(f"Order {filled_order[0]} is no longer being filled")
+
+def _append_portfolio_value(conn: sqlite3.Connection, name: str, timestamp: str, value: float) -> None:
+    conn.execute('INSERT INTO portfolio_values (name, datetime, value) VALUES (?, ?, ?)', (name, timestamp, value))
+    for resolution, (bucket_format, _) in PORTFOLIO_VALUE_RESOLUTIONS.items():
+        conn.execute('''
+            INSERT INTO portfolio_value_rollups (name, resolution, bucket, open, high, low, close, samples)
+            VALUES (?, ?, strftime(?, ?), ?, ?, ?, ?, 1)
+            ON CONFLICT(name, resolution, bucket) DO UPDATE SET
+                high=max(high, excluded.high),
+                low=min(low, excluded.low),
+                close=excluded.close,
+                samples=samples + 1
+        ''', (name, resolution, bucket_format, timestamp, value, value, value, value))
+
+_last_prune = 0.0
+
+def write_portfolio_value(name: str, timestamp: str, value: float) -> None:
+    """
+    Append one sample to an account's portfolio value time series and fold it into the rollups.
+    Expired samples and buckets are pruned at most once an hour per process.
+    """
+    global _last_prune
+    with transaction() as conn:
+        _append_portfolio_value(conn, name.lower(), timestamp, value)
+    if time.monotonic() - _last_prune > PRUNE_INTERVAL_SECONDS:
+        _last_prune = time.monotonic()
+        prune_portfolio_values()
+
+def _pick_resolution(days: float | None, max_points: int, age: float = 0.0) -> str:
+    """
+    The finest rollup that covers the window in at most max_points buckets and is still retained
+    for a window ending age days ago.
+    """
+    for resolution, (_, seconds) in PORTFOLIO_VALUE_RESOLUTIONS.items():
+        retention = PORTFOLIO_VALUE_RETENTION_DAYS[resolution]
+        if days is not None and days * 86400 / seconds <= max_points and (not retention or age + days <= retention):
+            return resolution
+    return "1d"
+
+def read_portfolio_values(name: str, days: float | None = None, resolution: str = "auto",
+                          max_points: int = PORTFOLIO_VALUE_MAX_POINTS,
+                          until: str | None = None) -> list[tuple[str, float]]:
+    """
+    Read an account's portfolio value history, downsampled to a bounded number of points.
+
+    Args:
+        name (str): The account name
+        days (float | None): How many days back to read; None for the whole history
+        resolution (str): "raw", "1m", "1h", "1d", or "auto" to pick the finest one that fits max_points
+        max_points (int): The most recent points to return at most
+        until (str | None): A "%Y-%m-%d %H:%M:%S" time the window ends at instead of now; with a rollup,
+            only buckets that had closed by then are included, so no later value leaks in
+
+    Returns:
+        list: A list of (datetime, value) tuples in time order, using the closing value of each bucket
+    """
+    end = datetime.strptime(until, "%Y-%m-%d %H:%M:%S") if until else datetime.now()
+    if resolution == "auto":
+        resolution = _pick_resolution(days, max_points, max(0.0, (datetime.now() - end).total_seconds() / 86400))
+    since = (end - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S") if days is not None else ""
+    until = until or "9999-12-31 23:59:59"
+    if resolution == "raw":
+        cursor = get_connection().execute('''
+            SELECT datetime, value FROM portfolio_values
+            WHERE name = ? AND datetime >= ? AND datetime <= ?
+            ORDER BY datetime DESC
+            LIMIT ?
+        ''', (name.lower(), since, until, max_points))
+    else:
+        bucket_format = PORTFOLIO_VALUE_RESOLUTIONS[resolution][0]
+        cursor = get_connection().execute('''
+            SELECT bucket, close FROM portfolio_value_rollups
+            WHERE name = ? AND resolution = ? AND bucket >= strftime(?, ?) AND bucket < strftime(?, ?)
+            ORDER BY bucket DESC
+            LIMIT ?
+        ''', (name.lower(), resolution, bucket_format, since or "0000-01-01", bucket_format, until, max_points))
+    return list(reversed(cursor.fetchall()))
+
+def read_portfolio_value_buckets(names: list[str], resolution: str, since: str = "") -> list[tuple[str, str, float]]:
+    """
+    Read the closing value of every rollup bucket from `since` onwards for several accounts in one
+    query, as (name, bucket, close) rows ordered by name and then bucket.
+    """
+    names = [name.lower() for name in names]
+    rows = []
+    for i in range(0, len(names), 500):
+        chunk = names[i:i + 500]
+        rows += get_connection().execute(f'''
+            SELECT name, bucket, close FROM portfolio_value_rollups
+            WHERE resolution = ? AND bucket >= ? AND name IN ({",".join("?" * len(chunk))})
+            ORDER BY name, bucket
+        ''', (resolution, since, *chunk)).fetchall()
+    return rows
+
+def read_first_portfolio_value_buckets(names: list[str], resolution: str) -> dict[str, str]:
+    """The oldest stored rollup bucket of each account that has any, from the primary key alone."""
+    names = [name.lower() for name in names]
+    first = {}
+    for i in range(0, len(names), 500):
+        chunk = names[i:i + 500]
+        first.update(get_connection().execute(f'''
+            SELECT name, MIN(bucket) FROM portfolio_value_rollups
+            WHERE resolution = ? AND name IN ({",".join("?" * len(chunk))}) GROUP BY name
+        ''', (resolution, *chunk)).fetchall())
+    return first
+
+def read_account_names() -> list[str]:
+    return [row[0] for row in get_connection().execute('SELECT name FROM accounts ORDER BY name')]
+
+def read_held_symbols(cache: dict[str, tuple[int, set[str]]] | None = None) -> set[str]:
+    """
+    Every symbol held by any account, from their current state without reading their histories.
+    Pass the same cache dict on every call to replay only the accounts whose version has changed since.
+    """
+    cache = {} if cache is None else cache
+    with read_transaction() as conn:
+        versions = dict(conn.execute('SELECT name, MAX(version) FROM account_events GROUP BY name'))
+        for name in cache.keys() - versions.keys():
+            del cache[name]
+        for name, version in versions.items():
+            if name not in cache or cache[name][0] != version:
+                state, _ = _replay(conn, name)
+                cache[name] = (version, set(state["holdings"]) if state else set())
+    return set().union(*(holdings for _, holdings in cache.values()))
+
+def prune_portfolio_values() -> None:
+    """Delete raw samples and rollup buckets older than their retention period."""
+    now = datetime.now()
+    with transaction() as conn:
+        for resolution, days in PORTFOLIO_VALUE_RETENTION_DAYS.items():
+            if not days:
+                continue
+            cutoff = (now - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+            if resolution == "raw":
+                conn.execute('DELETE FROM portfolio_values WHERE datetime < ?', (cutoff,))
+            else:
+                conn.execute(
+                    'DELETE FROM portfolio_value_rollups WHERE resolution = ? AND bucket < ?', (resolution, cutoff)
+                )
+
+def _backfill_portfolio_value_rollups() -> None:
+    """Build rollups for samples written before the rollup table existed."""
+    with transaction() as conn:
+        if conn.execute('SELECT 1 FROM portfolio_value_rollups LIMIT 1').fetchone():
+            return
+        samples = conn.execute('SELECT name, datetime, value FROM portfolio_values ORDER BY datetime, id').fetchall()
+        conn.execute('DELETE FROM portfolio_values')
+        for name, when, value in samples:
+            _append_portfolio_value(conn, name, when, value)
+
+
+_backfill_portfolio_value_rollups()
+_migrate_accounts_json()
+_migrate_account_rows()
+
+class LogWriter:
+    """
+    Group-commit writer for the logs table. Rows are put on a queue and a background thread
+    inserts them in batches, so callers never wait on disk I/O.
+    """
+
+    def __init__(self, batch_size: int = LOG_BATCH_SIZE, flush_interval: float = LOG_FLUSH_INTERVAL_SECONDS):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def write(self, row: tuple) -> None:
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+                    self._thread.start()
+        self._queue.put(row)
+
+    def flush(self, timeout: float | None = None) -> None:
+        """Block until every row queued before this call has been committed."""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def close(self) -> None:
+        """Commit whatever is still queued and stop the background thread."""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            batch, waiters = [], []
+            item = self._queue.get()
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is None:
+                    stopping = True
+                    break
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                    break
+                batch.append(item)
+                remaining = deadline - time.monotonic()
+                if len(batch) >= self.batch_size or remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if batch:
+                self._commit(batch)
+            for waiter in waiters:
+                waiter.set()
+
+    def _commit(self, batch: list[tuple]) -> None:
+        try:
+            with transaction() as conn:
+                conn.executemany(
+                    'INSERT INTO logs (name, datetime, type, message) VALUES (?, ?, ?, ?)', batch
+                )
+        except sqlite3.Error as e:
+            print(f"Was not able to write {len(batch)} log entries due to {e}")
+
+
+_log_writer = LogWriter()
+atexit.register(_log_writer.close)
 
-def read_account(name):
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT account FROM accounts WHERE name = ?', (name.lower(),))
-        row = cursor.fetchone()
-        return json.loads(row[0]) if row else None
-    
 def write_log(name: str, type: str, message: str):
     """
-    Write a log entry to the logs table.
-    
+    Queue a log entry for the logs table; it is committed in the background shortly after.
+
     Args:
         name (str): The name associated with the log
         type (str): The type of log entry
         message (str): The log message
     """
-    now = datetime.now().isoformat()
-    
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO logs (name, datetime, type, message)
-            VALUES (?, datetime('now'), ?, ?)
-        ''', (name.lower(), type, message))
-        conn.commit()
+    now = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+    _log_writer.write((name.lower(), now, type, message))
+
+def flush_logs() -> None:
+    """Wait until every queued log entry has been committed."""
+    _log_writer.flush()
 
 def read_log(name: str, last_n=10):
     """
     Read the most recent log entries for a given name.
-    
+
     Args:
         name (str): The name to retrieve logs for
         last_n (int): Number of most recent entries to retrieve
-        
+
     Returns:
         list: A list of tuples containing (datetime, type, message)
     """
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT datetime, type, message FROM logs 
-            WHERE name = ? 
-            ORDER BY datetime DESC
+    flush_logs()
+    cursor = get_connection().execute('''
+        SELECT datetime, type, message FROM logs
+        WHERE name = ?
+        ORDER BY id DESC
+        LIMIT ?
+    ''', (name.lower(), last_n))
+
+    return reversed(cursor.fetchall())
+
+def read_log_since(name: str, after_id: int | None = None, limit=100) -> list[tuple]:
+    """
+    Read log entries for a given name that are newer than a cursor, for cheap incremental polling.
+    Pass the id of the last entry received as after_id on the next call.
+
+    Args:
+        name (str): The name to retrieve logs for
+        after_id (int | None): Only return entries with a larger id; None starts from the latest `limit` entries
+        limit (int): Maximum number of entries to return
+
+    Returns:
+        list: A list of tuples containing (id, datetime, type, message), oldest first
+    """
+    flush_logs()
+    if after_id is None:
+        cursor = get_connection().execute('''
+            SELECT id, datetime, type, message FROM logs
+            WHERE name = ?
+            ORDER BY id DESC
             LIMIT ?
-        ''', (name.lower(), last_n))
-        
-        return reversed(cursor.fetchall())
+        ''', (name.lower(), limit))
+        return list(reversed(cursor.fetchall()))
+    cursor = get_connection().execute('''
+        SELECT id, datetime, type, message FROM logs
+        WHERE name = ? AND id > ?
+        ORDER BY id
+        LIMIT ?
+    ''', (name.lower(), after_id, limit))
+    return cursor.fetchall()
+
+ORDER_COLUMNS = ("id", "name", "symbol", "side", "quantity", "order_type", "trigger_price", "rationale",
+                 "status", "created", "updated", "fill_price", "note")
+
+def write_order(name: str, order: dict) -> int:
+    """Store a new open order and return its id."""
+    cursor = get_connection().execute('''
+        INSERT INTO orders (name, symbol, side, quantity, order_type, trigger_price, rationale, created)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (name.lower(), order["symbol"], order["side"], order["quantity"], order["order_type"],
+          order["trigger_price"], order.get("rationale", ""), datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+    return cursor.lastrowid
+
+def read_orders(name: str | None = None, status: str = "open") -> list[dict]:
+    """Read orders with the given status, for one account or (with name None) for every account, oldest first."""
+    sql = f'SELECT {", ".join(ORDER_COLUMNS)} FROM orders WHERE status = ?'
+    params = (status,)
+    if name is not None:
+        sql += ' AND name = ?'
+        params += (name.lower(),)
+    return [dict(zip(ORDER_COLUMNS, row)) for row in get_connection().execute(sql + ' ORDER BY id', params)]
+
+def write_live_prices(prices: dict[str, float], updated: float | None = None, watch: bool = False) -> None:
+    """
+    Publish fetched prices for every process to read; symbols without a price are skipped. With watch,
+    the priced symbols are also added to the price feed's watch list, in the same transaction.
+    """
+    updated = updated if updated is not None else time.time()
+    prices = {symbol: price for symbol, price in prices.items() if price}
+    if not prices:
+        return
+    with transaction() as conn:
+        conn.executemany('''
+            INSERT INTO live_prices (symbol, price, updated) VALUES (?, ?, ?)
+            ON CONFLICT(symbol) DO UPDATE SET price=excluded.price, updated=excluded.updated
+        ''', [(symbol, price, updated) for symbol, price in prices.items()])
+        if watch:
+            watch_symbols(list(prices))
+
+def read_live_prices(symbols: list[str], max_age: float) -> dict[str, float]:
+    """The published prices of the symbols that were fetched within max_age seconds; others are left out."""
+    symbols = list(dict.fromkeys(symbols))
+    cutoff = time.time() - max_age
+    prices = {}
+    for i in range(0, len(symbols), 500):
+        chunk = symbols[i:i + 500]
+        prices.update(get_connection().execute(
+            f'SELECT symbol, price FROM live_prices WHERE updated >= ? AND symbol IN ({",".join("?" * len(chunk))})',
+            (cutoff, *chunk),
+        ).fetchall())
+    return prices
+
+def watch_symbols(symbols: list[str]) -> None:
+    """Ask the price feed to publish these symbols from now on."""
+    now = time.time()
+    with transaction() as conn:
+        conn.executemany('''
+            INSERT INTO watched_symbols (symbol, requested) VALUES (?, ?)
+            ON CONFLICT(symbol) DO UPDATE SET requested=excluded.requested
+        ''', [(symbol, now) for symbol in symbols])
+
+def read_watched_symbols(max_age: float) -> list[str]:
+    """Symbols asked for within max_age seconds; older requests are forgotten."""
+    cutoff = time.time() - max_age
+    with transaction() as conn:
+        conn.execute('DELETE FROM watched_symbols WHERE requested < ?', (cutoff,))
+        return [row[0] for row in conn.execute('SELECT symbol FROM watched_symbols ORDER BY symbol')]
+
+def update_order(order_id: int, status: str, from_status: str = "open", fill_price: float | None = None,
+                 note: str | None = None, name: str | None = None) -> bool:
+    """
+    Move an order from from_status to status. Returns False if it was not in from_status (or does
+    not belong to name), so concurrent matchers and cancellations never act on the same order twice.
+    """
+    sql = '''
+        UPDATE orders SET status = ?, updated = ?, fill_price = COALESCE(?, fill_price), note = COALESCE(?, note)
+        WHERE id = ? AND status = ?
+    '''
+    params = (status, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), fill_price, note, order_id, from_status)
+    if name is not None:
+        sql += ' AND name = ?'
+        params += (name.lower(),)
+    return get_connection().execute(sql, params).rowcount == 1
+
+def reopen_stale_orders(older_than: float) -> int:
+    """
+    Reopen orders claimed for filling more than older_than seconds ago. Their fill was never booked,
+    since that marks them filled, so the matcher that claimed them must have stopped. Returns how many.
+    """
+    now = datetime.now()
+    cutoff = now - timedelta(seconds=older_than)
+    return get_connection().execute(
+        "UPDATE orders SET status = 'open', updated = ? WHERE status = 'filling' AND updated < ?",
+        (now.strftime("%Y-%m-%d %H:%M:%S"), cutoff.strftime("%Y-%m-%d %H:%M:%S")),
+    ).rowcount
 
 def write_market(date: str, data: dict) -> None:
-    data_json = json.dumps(data)
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO market (date, data)
-            VALUES (?, ?)
-            ON CONFLICT(date) DO UPDATE SET data=excluded.data
-        ''', (date, data_json))
-        conn.commit()
+    """Replace the stored snapshot for a date with the given {symbol: close} prices."""
+    with transaction() as conn:
+        conn.execute('DELETE FROM market_prices WHERE date = ?', (date,))
+        conn.executemany(
+            'INSERT INTO market_prices (date, symbol, close) VALUES (?, ?, ?)',
+            ((date, symbol, close) for symbol, close in data.items() if close is not None),
+        )
+
+def has_market(date: str) -> bool:
+    cursor = get_connection().execute('SELECT 1 FROM market_prices WHERE date = ? LIMIT 1', (date,))
+    return cursor.fetchone() is not None
+
+def read_market_prices(date: str, symbols: list[str]) -> dict[str, float]:
+    """Look up closing prices for a batch of symbols on a date; unknown symbols are left out."""
+    symbols = list(dict.fromkeys(symbols))
+    prices = {}
+    # Stay well under SQLite's limit on bound parameters per statement
+    for i in range(0, len(symbols), 500):
+        chunk = symbols[i:i + 500]
+        cursor = get_connection().execute(
+            f'SELECT symbol, close FROM market_prices WHERE date = ? AND symbol IN ({",".join("?" * len(chunk))})',
+            (date, *chunk),
+        )
+        prices.update(cursor.fetchall())
+    return prices
+
+def read_market_price(date: str, symbol: str) -> float | None:
+    cursor = get_connection().execute(
+        'SELECT close FROM market_prices WHERE date = ? AND symbol = ?', (date, symbol)
+    )
+    row = cursor.fetchone()
+    return row[0] if row else None
 
 def read_market(date: str) -> dict | None:
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT data FROM market WHERE date = ?', (date,))
-        row = cursor.fetchone()
-        return json.loads(row[0]) if row else None
\ No newline at end of file
+    """Read a whole day's snapshot as {symbol: close}; prefer the point lookups above."""
+    cursor = get_connection().execute('SELECT symbol, close FROM market_prices WHERE date = ?', (date,))
+    return dict(cursor.fetchall()) or None
+
+def read_market_history(start: str, end: str, symbols: list[str] | None = None) -> list[tuple[str, str, float]]:
+    """
+    Read every stored snapshot from start to end inclusive as (date, symbol, close) rows in date order,
+    for the given symbols only or for all of them when symbols is None.
+    """
+    conn = get_connection()
+    if symbols is None:
+        return conn.execute(
+            'SELECT date, symbol, close FROM market_prices WHERE date BETWEEN ? AND ? ORDER BY date', (start, end)
+        ).fetchall()
+    symbols = list(dict.fromkeys(symbols))
+    rows = []
+    for i in range(0, len(symbols), 500):
+        chunk = symbols[i:i + 500]
+        rows += conn.execute(
+            f'SELECT date, symbol, close FROM market_prices '
+            f'WHERE date BETWEEN ? AND ? AND symbol IN ({",".join("?" * len(chunk))})',
+            (start, end, *chunk),
+        ).fetchall()
+    return sorted(rows)
+
+def _migrate_market_json() -> None:
+    """Expand snapshots saved as one JSON document per date into market_prices rows, then drop the old table."""
+    with transaction() as conn:
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'market'").fetchone():
+            return
+        for date, data in conn.execute('SELECT date, data FROM market').fetchall():
+            if data:
+                write_market(date, json.loads(data))
+        conn.execute('DROP TABLE market')
+
+
+_migrate_market_json()
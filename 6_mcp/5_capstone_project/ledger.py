@@ -0,0 +1,187 @@
+"""
+A compact, array-backed transaction history for accounts.
+
+An account's history can run to many thousands of trades. Holding each as a pydantic
+Transaction costs hundreds of bytes and a validation pass per trade every time the account
+is loaded. The Ledger instead keeps one NumPy structured array of fixed-width records
+(database id, symbol id, quantity, price, epoch seconds) plus a table of symbol names,
+36 bytes a trade. The rationale text, by far the largest part of a trade, stays in the
+database and is fetched only for the trades actually turned back into Transactions.
+"""
+
+from datetime import datetime, timezone
+import numpy as np
+from pydantic import BaseModel
+from database import read_transaction_rationales
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+# How many Transactions iterating a Ledger builds, and fetches rationales for, at a time
+ITERATION_CHUNK = 1000
+
+LEDGER_DTYPE = np.dtype([
+    ("id", np.int64),
+    ("symbol", np.int32),
+    ("quantity", np.int64),
+    ("price", np.float64),
+    ("timestamp", np.int64),
+])
+
+
+class Transaction(BaseModel):
+    symbol: str
+    quantity: int
+    price: float
+    timestamp: str
+    rationale: str
+
+    def total(self) -> float:
+        return self.quantity * self.price
+    
+    def __repr__(self):
+        return f"{abs(self.quantity)} shares of {self.symbol} at {self.price} each."
+
+
+def _to_epoch(timestamp: str) -> int:
+    # Timestamps are naive local times; reading and writing them as UTC round-trips the text exactly
+    return int(datetime.fromisoformat(timestamp).replace(tzinfo=timezone.utc).timestamp())
+
+
+def _to_epochs(ids, timestamps) -> np.ndarray:
+    # Parsed in one pass, as naive times read as UTC like _to_epoch
+    try:
+        return np.array(timestamps, dtype="datetime64[s]").astype(np.int64)
+    except ValueError:
+        for id, timestamp in zip(ids, timestamps):
+            try:
+                _to_epoch(timestamp)
+            except (TypeError, ValueError):
+                raise ValueError(f"Transaction {id} has an unreadable timestamp {timestamp!r}") from None
+        raise
+
+
+def _from_epoch(epoch: int) -> str:
+    return datetime.fromtimestamp(int(epoch), timezone.utc).strftime(TIMESTAMP_FORMAT)
+
+
+class Ledger:
+    """
+    Append-only sequence of trades that behaves like the list of Transactions it replaces:
+    len(), iteration, indexing and slicing return Transactions, with rationales loaded on demand.
+    """
+
+    def __init__(self, records: np.ndarray | None = None, symbols: list[str] | None = None):
+        self._records = records if records is not None else np.empty(0, dtype=LEDGER_DTYPE)
+        self._size = len(self._records)
+        self._symbols = symbols or []
+        self._symbol_ids = {symbol: i for i, symbol in enumerate(self._symbols)}
+        # Rationales of trades made since loading, and of stored ones fetched so far, by position
+        self._rationales: dict[int, str] = {}
+
+    @classmethod
+    def from_rows(cls, rows: list[tuple]) -> "Ledger":
+        """
+        Build from (id, symbol, quantity, price, timestamp) rows, as read_account(compact=True) returns
+        them. Raises ValueError naming the transaction if a timestamp cannot be read.
+        """
+        records = np.empty(len(rows), dtype=LEDGER_DTYPE)
+        if not rows:
+            return cls(records)
+        ids, symbols, quantities, prices, timestamps = zip(*rows)
+        symbol_ids = {}
+        records["symbol"] = [symbol_ids.setdefault(symbol, len(symbol_ids)) for symbol in symbols]
+        records["id"], records["quantity"], records["price"] = ids, quantities, prices
+        records["timestamp"] = _to_epochs(ids, timestamps)
+        return cls(records, list(symbol_ids))
+
+    @classmethod
+    def from_transactions(cls, transactions) -> "Ledger":
+        """Build from Transactions or transaction dicts, such as an account dict's "transactions"."""
+        ledger = cls()
+        for transaction in transactions:
+            ledger.append(transaction)
+        return ledger
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _symbol_id(self, symbol: str) -> int:
+        if symbol not in self._symbol_ids:
+            self._symbol_ids[symbol] = len(self._symbols)
+            self._symbols.append(symbol)
+        return self._symbol_ids[symbol]
+
+    def append(self, transaction) -> None:
+        """Add a trade made in this process; it has no database id until the account is reloaded."""
+        if isinstance(transaction, dict):
+            transaction = Transaction(**transaction)
+        if self._size == len(self._records):
+            # Grow geometrically so appends stay amortized O(1)
+            grown = np.empty(max(16, 2 * len(self._records)), dtype=LEDGER_DTYPE)
+            grown[:self._size] = self._records[:self._size]
+            self._records = grown
+        self._records[self._size] = (
+            0, self._symbol_id(transaction.symbol), transaction.quantity, transaction.price,
+            _to_epoch(transaction.timestamp),
+        )
+        self._rationales[self._size] = transaction.rationale
+        self._size += 1
+
+    def snapshot(self) -> "Ledger":
+        """The trades as they are now, unaffected by later appends, for a write that may run later."""
+        ledger = Ledger(self.records, list(self._symbols))
+        ledger._rationales = dict(self._rationales)
+        return ledger
+
+    @property
+    def records(self) -> np.ndarray:
+        """The structured array of trades, for vectorized analysis; symbol ids index `symbols`."""
+        return self._records[:self._size]
+
+    @property
+    def symbols(self) -> list[str]:
+        return self._symbols
+
+    def _load_rationales(self, positions: range) -> None:
+        missing = [i for i in positions if i not in self._rationales]
+        if not missing:
+            return
+        ids = [int(self._records[i]["id"]) for i in missing]
+        rationales = read_transaction_rationales(ids)
+        for i, id in zip(missing, ids):
+            self._rationales[i] = rationales.get(id, "")
+
+    def _transaction(self, i: int) -> Transaction:
+        id, symbol, quantity, price, epoch = self._records[i].tolist()
+        return Transaction(
+            symbol=self._symbols[symbol], quantity=quantity, price=price,
+            timestamp=_from_epoch(epoch), rationale=self._rationales[i],
+        )
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            positions = range(*index.indices(self._size))
+            self._load_rationales(positions)
+            return [self._transaction(i) for i in positions]
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError("ledger index out of range")
+        self._load_rationales(range(index, index + 1))
+        return self._transaction(index)
+
+    def __iter__(self):
+        # A chunk at a time, so a long history is never held as Transactions all at once
+        for start in range(0, self._size, ITERATION_CHUNK):
+            yield from self[start:start + ITERATION_CHUNK]
+
+    def trades(self):
+        """(symbol, quantity, price) of each trade in order, read from the arrays without building Transactions."""
+        records = self.records
+        for symbol, quantity, price in zip(
+            records["symbol"].tolist(), records["quantity"].tolist(), records["price"].tolist()
+        ):
+            yield self._symbols[symbol], quantity, price
+
+    def to_dicts(self) -> list[dict]:
+        """The whole history in the list_transactions() format."""
+        return [transaction.model_dump() for transaction in self]
@@ -0,0 +1,186 @@
+"""
+Retention, archiving and compaction for the logs table.
+
+Every span of every trader run adds rows to logs, so left alone it becomes the largest table
+in accounts.db. This module trims it while the trading floor keeps running: rows are deleted
+in small batches, each in its own short transaction, so writers are never locked out for long.
+Rows can be archived first to one gzipped JSON-lines file per day before they are deleted.
+
+Run from this directory, for example:
+
+    uv run log_maintenance.py prune --days 14 --keep 20000 --archive-dir log_archive
+    uv run log_maintenance.py compact
+    uv run log_maintenance.py stats
+"""
+
+import argparse
+import gzip
+import json
+import os
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from dotenv import load_dotenv
+from database import get_connection, transaction, flush_logs
+
+load_dotenv(override=True)
+
+# Defaults for prune_logs(); 0 or empty disables that rule
+LOG_RETENTION_DAYS = int(os.getenv("LOG_RETENTION_DAYS", "0"))
+LOG_RETENTION_ROWS_PER_TRADER = int(os.getenv("LOG_RETENTION_ROWS_PER_TRADER", "0"))
+LOG_ARCHIVE_DIR = os.getenv("LOG_ARCHIVE_DIR", "")
+
+BATCH_SIZE = 2000
+PAUSE_SECONDS = 0.05
+
+
+def archive_rows(rows: list[tuple], archive_dir: str) -> None:
+    """Append (id, name, datetime, type, message) rows to one gzipped JSON-lines file per day."""
+    os.makedirs(archive_dir, exist_ok=True)
+    by_day = defaultdict(list)
+    for id, name, when, type, message in rows:
+        by_day[(when or "unknown")[:10]].append(
+            {"id": id, "name": name, "datetime": when, "type": type, "message": message}
+        )
+    for day, entries in by_day.items():
+        # Appending to a gzip file adds a new member; readers see one continuous stream
+        with gzip.open(os.path.join(archive_dir, f"logs-{day}.jsonl.gz"), "at", encoding="utf-8") as f:
+            f.writelines(json.dumps(entry) + "\n" for entry in entries)
+
+
+def _remove(rows: list[tuple], archive_dir: str) -> int:
+    if archive_dir:
+        archive_rows(rows, archive_dir)
+    with transaction() as conn:
+        conn.executemany("DELETE FROM logs WHERE id = ?", [(row[0],) for row in rows])
+    time.sleep(PAUSE_SECONDS)
+    return len(rows)
+
+
+def prune_by_age(days: int, archive_dir: str = "", batch_size: int = BATCH_SIZE) -> int:
+    """
+    Delete log rows older than the given number of days, oldest first.
+    Ids grow with time, so this walks the rowid order and stops at the first row inside the window.
+    """
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+    removed = 0
+    while True:
+        rows = get_connection().execute(
+            "SELECT id, name, datetime, type, message FROM logs ORDER BY id LIMIT ?", (batch_size,)
+        ).fetchall()
+        expired = []
+        for row in rows:
+            if row[2] is not None and row[2] >= cutoff:
+                break
+            expired.append(row)
+        if expired:
+            removed += _remove(expired, archive_dir)
+        if len(expired) < batch_size:
+            return removed
+
+
+def prune_by_count(keep: int, archive_dir: str = "", batch_size: int = BATCH_SIZE) -> int:
+    """Delete all but the newest `keep` log rows of each trader."""
+    removed = 0
+    names = [row[0] for row in get_connection().execute("SELECT DISTINCT name FROM logs")]
+    for name in names:
+        row = get_connection().execute(
+            "SELECT id FROM logs WHERE name IS ? ORDER BY id DESC LIMIT 1 OFFSET ?", (name, keep)
+        ).fetchone()
+        if not row:
+            continue
+        while True:
+            rows = get_connection().execute(
+                "SELECT id, name, datetime, type, message FROM logs WHERE name IS ? AND id <= ? ORDER BY id LIMIT ?",
+                (name, row[0], batch_size),
+            ).fetchall()
+            if not rows:
+                break
+            removed += _remove(rows, archive_dir)
+    return removed
+
+
+def prune_logs(
+    days: int = LOG_RETENTION_DAYS,
+    keep: int = LOG_RETENTION_ROWS_PER_TRADER,
+    archive_dir: str = LOG_ARCHIVE_DIR,
+) -> int:
+    """
+    Apply the configured retention rules, archiving removed rows if archive_dir is set.
+
+    Args:
+        days (int): Delete rows older than this many days; 0 disables the age rule
+        keep (int): Keep at most this many rows per trader; 0 disables the count rule
+        archive_dir (str): Directory for the per-day gzip archives; empty deletes without archiving
+
+    Returns:
+        int: The number of rows removed
+    """
+    flush_logs()
+    start = time.perf_counter()
+    removed = 0
+    if days:
+        removed += prune_by_age(days, archive_dir)
+    if keep:
+        removed += prune_by_count(keep, archive_dir)
+    if removed:
+        elapsed = time.perf_counter() - start
+        print(f"Pruned {removed} log rows in {elapsed:.2f}s ({removed / elapsed:,.0f} rows/sec)")
+    return removed
+
+
+def compact(full: bool = False, pages_per_step: int = 1000) -> None:
+    """
+    Return free pages to the filesystem in small steps and truncate the WAL.
+
+    Databases created before incremental auto-vacuum was enabled need one full VACUUM (`full=True`)
+    to switch modes. That one run rewrites the file and blocks writers while it does.
+    """
+    conn = get_connection()
+    if full:
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("VACUUM")
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        print("This database does not use incremental auto-vacuum; run `compact --vacuum` once while idle")
+    else:
+        freed = 0
+        while free_pages := conn.execute("PRAGMA freelist_count").fetchone()[0]:
+            step = min(free_pages, pages_per_step)
+            # executescript steps the pragma to completion; execute() would release only one page
+            conn.executescript(f"PRAGMA incremental_vacuum({step})")
+            freed += step
+            time.sleep(PAUSE_SECONDS)
+        print(f"Released {freed} free pages")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+def stats() -> None:
+    conn = get_connection()
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    pages = conn.execute("PRAGMA page_count").fetchone()[0]
+    free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    print(f"Database: {pages * page_size / 1e6:.1f} MB, {free * page_size / 1e6:.1f} MB free")
+    for name, count, oldest, newest in conn.execute(
+        "SELECT name, COUNT(*), MIN(datetime), MAX(datetime) FROM logs GROUP BY name ORDER BY name"
+    ):
+        print(f"{name:<12} {count:>10} rows from {oldest} to {newest}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    prune = commands.add_parser("prune", help="delete (and optionally archive) old log rows")
+    prune.add_argument("--days", type=int, default=LOG_RETENTION_DAYS, help="keep rows newer than this many days")
+    prune.add_argument("--keep", type=int, default=LOG_RETENTION_ROWS_PER_TRADER, help="keep this many rows per trader")
+    prune.add_argument("--archive-dir", default=LOG_ARCHIVE_DIR, help="write removed rows to gzip files here")
+    compact_parser = commands.add_parser("compact", help="release free pages and truncate the WAL")
+    compact_parser.add_argument("--vacuum", action="store_true", help="one-time blocking VACUUM to enable incremental mode")
+    commands.add_parser("stats", help="show database size and log rows per trader")
+    args = parser.parse_args()
+
+    if args.command == "prune":
+        prune_logs(args.days, args.keep, args.archive_dir)
+    elif args.command == "compact":
+        compact(full=args.vacuum)
+    else:
+        stats()
@@ -1,9 +1,14 @@
-from polygon import RESTClient
 from dotenv import load_dotenv
 import os
+import re
 from datetime import datetime
-import random
-from database import write_market, read_market
+import threading
+import time
+from database import write_market, has_market, read_market_prices, read_live_prices, write_live_prices
+from polygon_client import get_client
+from polygon.exceptions import BadResponse
+from market_calendar import MarketCalendar
+from synthetic_market import get_synthetic_prices
 from functools import lru_cache
 from datetime import timezone
 
@@ -12,19 +17,173 @@ load_dotenv(override=True)
 polygon_api_key = os.getenv("POLYGON_API_KEY")
 polygon_plan = os.getenv("POLYGON_PLAN")
 
+# Where prices come from: "polygon", or "synthetic" for the seeded simulator in synthetic_market.py,
+# which is the default without an API key and can be forced for offline runs and load tests
+PRICE_SOURCE = os.getenv("PRICE_SOURCE", "polygon" if polygon_api_key else "synthetic")
+uses_polygon = PRICE_SOURCE == "polygon" and bool(polygon_api_key)
+
 is_paid_polygon = polygon_plan == "paid"
 is_realtime_polygon = polygon_plan == "realtime"
+# Both paid plans price from live snapshots (15-minute delayed or realtime); the free plan from the prior close
+uses_snapshots = is_paid_polygon or is_realtime_polygon
+
+# How long a fetched price is reused before Polygon is asked again, by plan: the prior close changes once
+# a day, delayed snapshots every minute, realtime ones constantly. PRICE_CACHE_TTL_SECONDS overrides it.
+PRICE_CACHE_TTL_BY_PLAN = {"eod": 600.0, "paid": 60.0, "realtime": 2.0}
+PRICE_CACHE_TTL_SECONDS = float(
+    os.getenv("PRICE_CACHE_TTL_SECONDS", PRICE_CACHE_TTL_BY_PLAN.get(polygon_plan, PRICE_CACHE_TTL_BY_PLAN["eod"]))
+)
+
+# Prices published by the price feed (price_feed.py) are used while younger than PRICE_FEED_MAX_AGE_SECONDS.
+# The feed polls every PRICE_FEED_INTERVAL_SECONDS, and keeps publishing a symbol some process asked
+# for until nobody has asked for PRICE_FEED_WATCH_SECONDS.
+PRICE_FEED_INTERVAL_SECONDS = float(os.getenv("PRICE_FEED_INTERVAL_SECONDS", PRICE_CACHE_TTL_SECONDS))
+PRICE_FEED_MAX_AGE_SECONDS = float(os.getenv("PRICE_FEED_MAX_AGE_SECONDS", 2 * PRICE_FEED_INTERVAL_SECONDS))
+PRICE_FEED_WATCH_SECONDS = float(os.getenv("PRICE_FEED_WATCH_SECONDS", "86400"))
+
+# Whether the market is open is answered from a local calendar; with an API key, Polygon's list of
+# upcoming holidays is applied on top every MARKET_CALENDAR_REFRESH_HOURS (0 never asks it)
+MARKET_CALENDAR_REFRESH_HOURS = float(os.getenv("MARKET_CALENDAR_REFRESH_HOURS", "24"))
+market_calendar = MarketCalendar()
+
+
+class _Flight:
+    """One upstream lookup that other threads asking for the same symbol wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.price = None
+        self.error = None
+
+    def wait(self) -> float | None:
+        self.done.wait()
+        if self.error:
+            raise self.error
+        return self.price
+
+
+class PriceCache:
+    """
+    In-process cache of share prices with a TTL. Concurrent lookups of a symbol that is not cached
+    share a single upstream request: the first caller fetches it, the others wait for its result.
+    """
+
+    def __init__(self, ttl: float = PRICE_CACHE_TTL_SECONDS):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.upstream_calls = 0
+        self._prices: dict[str, tuple[float, float]] = {}
+        self._flights: dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+
+    def get_many(self, symbols: list[str], fetch) -> dict[str, float]:
+        """
+        Return prices for the symbols, calling fetch(missing_symbols) once for those neither cached
+        nor already being fetched. Symbols fetch cannot price are left out and not cached.
+        """
+        prices, waiting, missing = {}, {}, []
+        with self._lock:
+            now = time.monotonic()
+            for symbol in symbols:
+                entry = self._prices.get(symbol)
+                if entry and now - entry[1] < self.ttl:
+                    self.hits += 1
+                    prices[symbol] = entry[0]
+                elif symbol in self._flights:
+                    self.coalesced += 1
+                    waiting[symbol] = self._flights[symbol]
+                else:
+                    self.misses += 1
+                    self._flights[symbol] = _Flight()
+                    missing.append(symbol)
+            if missing:
+                self.upstream_calls += 1
+        if missing:
+            try:
+                fetched = fetch(missing)
+            except BaseException as e:
+                with self._lock:
+                    for symbol in missing:
+                        flight = self._flights.pop(symbol)
+                        flight.error = e
+                        flight.done.set()
+                raise
+            with self._lock:
+                now = time.monotonic()
+                for symbol in missing:
+                    price = fetched.get(symbol)
+                    if price:
+                        self._prices[symbol] = (price, now)
+                        prices[symbol] = price
+                    flight = self._flights.pop(symbol)
+                    flight.price = price
+                    flight.done.set()
+        for symbol, flight in waiting.items():
+            price = flight.wait()
+            if price:
+                prices[symbol] = price
+        return prices
+
+    def clear(self) -> None:
+        with self._lock:
+            self._prices.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "upstream_calls": self.upstream_calls,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "cached": len(self._prices),
+                "ttl_seconds": self.ttl,
+            }
+
+
+_price_cache = PriceCache()
+
+
+def price_cache_stats() -> dict:
+    """
+    Hit rate and upstream lookup counts of this process's price cache. Coalesced lookups waited on
+    another's; upstream calls went to the shared live prices and then, for what they lacked, to Polygon
+    (polygon_client.polygon_client_stats counts the Polygon requests themselves).
+    """
+    return _price_cache.stats()
+
+
+def _refresh_calendar() -> None:
+    # Polygon's upcoming holidays only add closures announced at short notice, so ask rarely
+    if not polygon_api_key or not MARKET_CALENDAR_REFRESH_HOURS:
+        return
+    if time.time() - market_calendar.refreshed < MARKET_CALENDAR_REFRESH_HOURS * 3600:
+        return
+    try:
+        market_calendar.refresh(get_client())
+    except Exception as e:
+        # Keep to the local rules until the next refresh is due
+        market_calendar.refreshed = time.time()
+        print(f"Was not able to refresh the market calendar from polygon due to {e}")
 
 
 def is_market_open() -> bool:
-    client = RESTClient(polygon_api_key)
-    market_status = client.get_market_status()
-    return market_status.market == "open"
+    _refresh_calendar()
+    return market_calendar.is_open()
+
+
+def seconds_until_market_opens() -> float:
+    """Seconds until the next regular session starts; 0 while the market is open."""
+    _refresh_calendar()
+    return market_calendar.seconds_until_open()
 
 
 def get_all_share_prices_polygon_eod() -> dict[str, float]:
     """With much thanks to student Reema R. for fixing the timezone issue with this!"""
-    client = RESTClient(polygon_api_key)
+    client = get_client()
 
     probe = client.get_previous_close_agg("SPY")[0]
     last_close = datetime.fromtimestamp(probe.timestamp / 1000, tz=timezone.utc).date()
@@ -33,43 +192,110 @@ def get_all_share_prices_polygon_eod() -> dict[str, float]:
     return {result.ticker: result.close for result in results}
 
 
-@lru_cache(maxsize=2)
-def get_market_for_prior_date(today):
-    # Attempt to read cached market data for the given date from the database.
-    # This helps avoid unnecessary API calls if we've already fetched and stored the data.
-    market_data = read_market(today)
-    if not market_data:
-        market_data = get_all_share_prices_polygon_eod()
-        write_market(today, market_data)
-    return market_data
+@lru_cache(maxsize=32)
+def store_market_for_prior_date(today) -> None:
+    # Make sure the prior day's snapshot for this date is in the database, fetching it from Polygon only once.
+    # Only the fact that it is stored is cached here, so memory stays flat however many dates are used.
+    if not has_market(today):
+        write_market(today, get_all_share_prices_polygon_eod())
+
+
+def get_market_for_prior_date(today, symbols) -> dict[str, float]:
+    # Look up just the requested symbols in the stored snapshot rather than loading the whole day
+    store_market_for_prior_date(today)
+    return read_market_prices(today, symbols)
 
 
 def get_share_price_polygon_eod(symbol) -> float:
     today = datetime.now().date().strftime("%Y-%m-%d")
-    market_data = get_market_for_prior_date(today)
+    market_data = get_market_for_prior_date(today, [symbol])
     return market_data.get(symbol, 0.0)
 
 
+def get_share_prices_polygon_eod(symbols) -> dict[str, float]:
+    today = datetime.now().date().strftime("%Y-%m-%d")
+    market_data = get_market_for_prior_date(today, symbols)
+    return {symbol: market_data.get(symbol, 0.0) for symbol in symbols}
+
+
+def _snapshot_price(result) -> float:
+    # Prefer the current minute's close; fall back to the previous day's close when the market is closed
+    return (result.min and result.min.close) or (result.prev_day and result.prev_day.close) or 0.0
+
+
+def get_share_prices_polygon_min(symbols) -> dict[str, float]:
+    # One snapshot request covers every ticker
+    client = get_client()
+    results = client.get_snapshot_all("stocks", tickers=list(symbols))
+    return {result.ticker: _snapshot_price(result) for result in results}
+
+
 def get_share_price_polygon_min(symbol) -> float:
-    client = RESTClient(polygon_api_key)
-    result = client.get_snapshot_ticker("stocks", symbol)
-    # Return the most recent available closing price for the symbol.
-    # Prefer the current minute's close price (result.min.close).
-    # If that's not available (e.g., market is closed or no data), fall back to the previous day's close (result.prev_day.close).
-    return result.min.close or result.prev_day.close
+    client = get_client()
+    try:
+        result = client.get_snapshot_ticker("stocks", symbol)
+    except BadResponse as e:
+        # Polygon answers a ticker it does not know with NOT_FOUND; that is an unrecognized symbol, not an error
+        if "NOT_FOUND" in str(e):
+            return 0.0
+        raise
+    return _snapshot_price(result)
+
+
+def fetch_prices_upstream(symbols: list[str]) -> dict[str, float]:
+    """Fetch prices from Polygon: one snapshot request on the paid plans, the stored prior close otherwise."""
+    if not uses_snapshots:
+        return get_share_prices_polygon_eod(symbols)
+    if len(symbols) == 1:
+        return {symbols[0]: get_share_price_polygon_min(symbols[0])}
+    # The snapshot leaves out tickers Polygon does not know, so those are priced at 0.0 here
+    prices = get_share_prices_polygon_min(symbols)
+    return {symbol: prices.get(symbol, 0.0) for symbol in symbols}
+
+
+def _fetch_prices(symbols: list[str]) -> dict[str, float]:
+    # The lookup behind the price cache: fresh prices published by the feed or another process first,
+    # then Polygon for the rest. Those it prices are published in turn and added to the feed's watch
+    # list in one write; a mistyped symbol priced at 0.0 is neither, so the feed never polls it.
+    prices = read_live_prices(symbols, PRICE_FEED_MAX_AGE_SECONDS)
+    missing = [symbol for symbol in symbols if symbol not in prices]
+    if missing:
+        fetched = fetch_prices_upstream(missing)
+        write_live_prices(fetched, watch=True)
+        prices.update({symbol: fetched.get(symbol, 0.0) for symbol in missing})
+    return prices
 
 
 def get_share_price_polygon(symbol) -> float:
-    if is_paid_polygon:
-        return get_share_price_polygon_min(symbol)
-    else:
-        return get_share_price_polygon_eod(symbol)
+    return _price_cache.get_many([symbol], _fetch_prices).get(symbol, 0.0)
+
+
+# The simulator would price any string, so only what could be a listed ticker gets a synthetic price;
+# anything else is 0.0, which buy_shares and execute_basket reject as an unrecognized symbol
+TICKER_PATTERN = re.compile(r"[A-Z]{1,5}(\.[A-Z])?")
+
+
+def _synthetic_prices(symbols: list[str]) -> dict[str, float]:
+    prices = get_synthetic_prices([symbol for symbol in symbols if TICKER_PATTERN.fullmatch(symbol)])
+    return {symbol: prices.get(symbol, 0.0) for symbol in symbols}
 
 
 def get_share_price(symbol) -> float:
-    if polygon_api_key:
-        try:
-            return get_share_price_polygon(symbol)
-        except Exception as e:
-            print(f"Was not able to use the polygon API due to {e}; using a random number")
-    return float(random.randint(1, 100))
+    # With Polygon, a symbol it does not know is 0.0, and a rate-limited request waits its turn and
+    # failures are retried, so an error that still gets through is raised rather than hidden behind a
+    # made-up price
+    if uses_polygon:
+        return get_share_price_polygon(symbol)
+    return _synthetic_prices([symbol])[symbol]
+
+
+def get_share_prices(symbols) -> dict[str, float]:
+    """
+    Price several symbols with one request for those not in the price cache; a symbol the batch
+    did not return is unrecognized and priced at 0.0. Synthetic prices are computed together in one pass.
+    """
+    symbols = list(dict.fromkeys(symbols))
+    if not uses_polygon:
+        return _synthetic_prices(symbols)
+    prices = _price_cache.get_many(symbols, _fetch_prices) if symbols else {}
+    return {symbol: prices.get(symbol, 0.0) for symbol in symbols}
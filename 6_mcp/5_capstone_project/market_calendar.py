@@ -0,0 +1,165 @@
+"""
+A local trading calendar for the NYSE and Nasdaq, which keep the same schedule.
+
+Regular sessions run from 9:30 to 16:00 New York time on weekdays. The exchange holidays, their
+weekend observance rules and the 13:00 early closes are computed from their rules for any year, so
+asking whether the market is open takes a dictionary lookup rather than a network call. Closures
+announced at short notice, such as national days of mourning, are listed in UNSCHEDULED_CLOSURES and
+can also be picked up with refresh(), which reads Polygon's list of upcoming holidays.
+"""
+
+import threading
+import time
+from datetime import date, datetime, time as clock, timedelta, timezone
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+
+NEW_YORK = ZoneInfo("America/New_York")
+REGULAR_OPEN = clock(9, 30)
+REGULAR_CLOSE = clock(16, 0)
+EARLY_CLOSE = clock(13, 0)
+
+# Closures that follow no rule
+UNSCHEDULED_CLOSURES = {
+    date(2012, 10, 29),  # Hurricane Sandy
+    date(2012, 10, 30),
+    date(2018, 12, 5),   # President George H. W. Bush
+    date(2025, 1, 9),    # President Jimmy Carter
+}
+
+
+def _nth_weekday(year: int, month: int, weekday: int, n: int) -> date:
+    """The nth given weekday (Monday is 0) of a month; n = -1 for the last one."""
+    if n > 0:
+        first = date(year, month, 1)
+        return first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    last = date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+    return last - timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def _easter(year: int) -> date:
+    """Easter Sunday in the Gregorian calendar (the anonymous Gregorian algorithm)."""
+    a, (b, c) = year % 19, divmod(year, 100)
+    d, e = divmod(b, 4)
+    g = (b - (b + 8) // 25 + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+def _observed(day: date) -> date:
+    # A holiday on a Saturday is observed on the Friday before, one on a Sunday on the Monday after
+    if day.weekday() == 5:
+        return day - timedelta(days=1)
+    if day.weekday() == 6:
+        return day + timedelta(days=1)
+    return day
+
+
+@lru_cache(maxsize=64)
+def holidays(year: int) -> frozenset[date]:
+    """The weekdays of a year on which the exchanges are closed."""
+    days = {
+        _nth_weekday(year, 1, 0, 3),       # Martin Luther King Jr. Day
+        _nth_weekday(year, 2, 0, 3),       # Washington's Birthday
+        _easter(year) - timedelta(days=2), # Good Friday
+        _nth_weekday(year, 5, 0, -1),      # Memorial Day
+        _observed(date(year, 7, 4)),       # Independence Day
+        _nth_weekday(year, 9, 0, 1),       # Labor Day
+        _nth_weekday(year, 11, 3, 4),      # Thanksgiving
+        _observed(date(year, 12, 25)),     # Christmas
+    }
+    # New Year's Day falling on a Saturday is not observed on the last trading day of the year before
+    new_year = date(year, 1, 1)
+    if new_year.weekday() != 5:
+        days.add(_observed(new_year))
+    if year >= 2022:
+        days.add(_observed(date(year, 6, 19)))  # Juneteenth
+    days |= {day for day in UNSCHEDULED_CLOSURES if day.year == year}
+    return frozenset(day for day in days if day.weekday() < 5)
+
+
+@lru_cache(maxsize=64)
+def early_closes(year: int) -> frozenset[date]:
+    """The days of a year on which the exchanges close at 13:00."""
+    days = {
+        date(year, 7, 3),                                   # the day before Independence Day
+        _nth_weekday(year, 11, 3, 4) + timedelta(days=1),   # the day after Thanksgiving
+        date(year, 12, 24),                                 # Christmas Eve
+    }
+    # July 3 and December 24 only close early from Monday to Thursday; on a Friday they are the observed holiday
+    return frozenset(day for day in days if day.weekday() < 4 or day.month == 11)
+
+
+class MarketCalendar:
+    """Trading sessions by date, from the rules above plus any corrections fetched with refresh()."""
+
+    def __init__(self):
+        # Dates whose session Polygon reports differently from the rules: None when closed, else (open, close)
+        self._overrides: dict[date, tuple[datetime, datetime] | None] = {}
+        self._sessions: dict[date, tuple[datetime, datetime] | None] = {}
+        self._lock = threading.Lock()
+        self.refreshed = 0.0
+
+    def session(self, day: date) -> tuple[datetime, datetime] | None:
+        """The opening and closing times of a date's session in New York time, or None if the market is closed."""
+        if day in self._sessions:
+            return self._sessions[day]
+        if day in self._overrides:
+            session = self._overrides[day]
+        elif day.weekday() >= 5 or day in holidays(day.year):
+            session = None
+        else:
+            close = EARLY_CLOSE if day in early_closes(day.year) else REGULAR_CLOSE
+            session = (datetime.combine(day, REGULAR_OPEN, NEW_YORK), datetime.combine(day, close, NEW_YORK))
+        self._sessions[day] = session
+        return session
+
+    def is_open(self, at: datetime | None = None) -> bool:
+        """Whether a regular session is in progress at a time (now by default)."""
+        at = (at or datetime.now(timezone.utc)).astimezone(NEW_YORK)
+        session = self.session(at.date())
+        return session is not None and session[0] <= at < session[1]
+
+    def next_open(self, at: datetime | None = None) -> datetime:
+        """The start of the next session after a time, or the time itself during a session."""
+        at = (at or datetime.now(timezone.utc)).astimezone(NEW_YORK)
+        day = at.date()
+        # No run of closed days is anywhere near this long
+        for _ in range(30):
+            session = self.session(day)
+            if session and at < session[1]:
+                return max(at, session[0])
+            day += timedelta(days=1)
+        raise RuntimeError(f"No trading session found within 30 days of {at}")
+
+    def seconds_until_open(self, at: datetime | None = None) -> float:
+        """Seconds from a time (now by default) until the market next opens; 0 while it is open."""
+        at = (at or datetime.now(timezone.utc)).astimezone(NEW_YORK)
+        return (self.next_open(at) - at).total_seconds()
+
+    def refresh(self, client) -> int:
+        """
+        Apply Polygon's upcoming NYSE holidays and early closes over the rules, for closures announced
+        at short notice. Returns how many upcoming dates Polygon listed.
+        """
+        overrides = {}
+        for holiday in client.get_market_holidays():
+            if holiday.exchange != "NYSE" or not holiday.date:
+                continue
+            day = date.fromisoformat(holiday.date)
+            if holiday.status == "closed":
+                overrides[day] = None
+            elif holiday.status == "early-close" and holiday.open and holiday.close:
+                overrides[day] = tuple(
+                    datetime.fromisoformat(value.replace("Z", "+00:00")).astimezone(NEW_YORK)
+                    for value in (holiday.open, holiday.close)
+                )
+        with self._lock:
+            self._overrides.update(overrides)
+            self._sessions.clear()
+            self.refreshed = time.time()
+        return len(overrides)
@@ -0,0 +1,98 @@
+"""
+Matching of resting limit and stop orders against fresh prices.
+
+match_orders() reads every open order of every account, prices all their symbols with one
+batched lookup, and decides which orders have triggered in a single vectorized comparison.
+Only the triggered orders are then filled, each through its account at the batch price, so
+traders can place a conditional order once instead of polling the price every run.
+
+An order is claimed (moved to "filling") before it is filled, and marked filled in the same
+transaction that books its trade. An order left claimed by a matcher that stopped part way is
+reopened after ORDER_FILL_TIMEOUT_SECONDS. One that fails for any reason other than a
+rejection is reopened for the next pass, and matching carries on with the rest.
+
+Run from this directory to match once, for example:
+
+    uv run order_matching.py
+"""
+
+import os
+import numpy as np
+from dotenv import load_dotenv
+from accounts import Account, RestingOrder, SPREAD
+from database import read_orders, update_order, reopen_stale_orders, OrderClosed
+from market import get_share_prices
+
+load_dotenv(override=True)
+
+# How long an order may stay claimed for filling before it is taken to be abandoned and reopened
+ORDER_FILL_TIMEOUT_SECONDS = float(os.getenv("ORDER_FILL_TIMEOUT_SECONDS", "300"))
+
+
+def triggered(prices: np.ndarray, triggers: np.ndarray, is_buy: np.ndarray, is_limit: np.ndarray) -> np.ndarray:
+    """
+    Which orders have reached their trigger price. Limit buys and stop sells trigger at or below
+    it; limit sells and stop buys at or above it. A limit is compared with the price the trade
+    would actually get after the spread, so it is never filled at worse than its limit.
+    Orders with no price never trigger.
+    """
+    execution = np.where(is_buy, prices * (1 + SPREAD), prices * (1 - SPREAD))
+    compared = np.where(is_limit, execution, prices)
+    at_or_below = is_buy == is_limit
+    return (prices > 0) & np.where(at_or_below, compared <= triggers, compared >= triggers)
+
+
+def match_orders(prices: dict[str, float] | None = None) -> list[dict]:
+    """
+    Fill every open order whose trigger price has been reached.
+
+    Args:
+        prices (dict): A price batch to match against; fetched with get_share_prices when None
+
+    Returns:
+        list: The triggered orders, each with its resulting status and fill price or note
+    """
+    reopened = reopen_stale_orders(ORDER_FILL_TIMEOUT_SECONDS)
+    if reopened:
+        print(f"Reopened {reopened} orders left claimed by an interrupted matching pass")
+    orders = read_orders()
+    if not orders:
+        return []
+    if prices is None:
+        prices = get_share_prices(order["symbol"] for order in orders)
+
+    current = np.array([prices.get(order["symbol"], 0.0) for order in orders], dtype=np.float64)
+    triggers = np.array([order["trigger_price"] for order in orders], dtype=np.float64)
+    is_buy = np.array([order["side"] == "buy" for order in orders])
+    is_limit = np.array([order["order_type"] == "limit" for order in orders])
+    hits = np.flatnonzero(triggered(current, triggers, is_buy, is_limit))
+
+    results = []
+    for i in hits:
+        order = orders[i]
+        # Claim the order first, so a cancellation or another matcher cannot act on it as well
+        if not update_order(order["id"], "filling"):
+            continue
+        price = float(current[i])
+        try:
+            Account.get(order["name"]).fill_order(RestingOrder(**order), price, order["id"])
+        except OrderClosed:
+            # Reopened as stale and taken by another pass meanwhile; no trade was booked here
+            continue
+        except ValueError as e:
+            if update_order(order["id"], "rejected", from_status="filling", note=str(e)):
+                results.append({**order, "status": "rejected", "note": str(e)})
+            continue
+        except Exception as e:
+            # Reopen it for the next pass, unless its trade was booked before the error
+            if update_order(order["id"], "open", from_status="filling"):
+                print(f"Was not able to fill order {order['id']} for {order['name']} due to {e}")
+                continue
+        results.append({**order, "status": "filled", "fill_price": price})
+    return results
+
+
+if __name__ == "__main__":
+    for result in match_orders():
+        detail = f"at {result['fill_price']}" if result["status"] == "filled" else f"({result['note']})"
+        print(f"Order {result['id']} for {result['name']}: {result['status']} {detail}")
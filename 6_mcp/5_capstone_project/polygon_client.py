@@ -0,0 +1,165 @@
+"""
+One shared Polygon client per process, with a token-bucket rate limit and retries.
+
+Every request, retries included, first takes a token from a bucket sized to the plan's limit. When
+the bucket is empty the request waits its turn instead of failing, so a burst of lookups from
+several traders queues up rather than tripping the limit. Rate-limit responses (429), server
+errors and dropped connections are retried with exponential backoff, honouring Retry-After.
+A request waits at most POLYGON_MAX_WAIT_SECONDS in all for tokens and backoff; past that it
+fails with RateLimited, rather than holding its caller's thread for minutes on the free plan.
+The client keeps its HTTP connections open between requests.
+"""
+
+import os
+import random
+import threading
+import time
+import certifi
+import urllib3
+from urllib3.util.retry import Retry
+from dotenv import load_dotenv
+from polygon import RESTClient
+
+load_dotenv(override=True)
+
+polygon_api_key = os.getenv("POLYGON_API_KEY")
+polygon_plan = os.getenv("POLYGON_PLAN")
+
+# Requests per minute each plan allows; the free plan allows 5, the paid ones are unmetered but
+# should stay under about 100 a second. POLYGON_REQUESTS_PER_MINUTE overrides it.
+POLYGON_RATE_LIMIT_BY_PLAN = {"eod": 5, "paid": 6000, "realtime": 6000}
+POLYGON_REQUESTS_PER_MINUTE = float(
+    os.getenv("POLYGON_REQUESTS_PER_MINUTE", POLYGON_RATE_LIMIT_BY_PLAN.get(polygon_plan, POLYGON_RATE_LIMIT_BY_PLAN["eod"]))
+)
+# How many times a failed request is retried, and the first backoff in seconds (doubled on each retry)
+POLYGON_MAX_RETRIES = int(os.getenv("POLYGON_MAX_RETRIES", "4"))
+POLYGON_BACKOFF_SECONDS = float(os.getenv("POLYGON_BACKOFF_SECONDS", "1.0"))
+# The longest a request may spend waiting for the rate limit and backing off before it gives up
+POLYGON_MAX_WAIT_SECONDS = float(os.getenv("POLYGON_MAX_WAIT_SECONDS", "30"))
+# Open connections kept for reuse, so concurrent threads do not each open a fresh one
+POLYGON_POOL_SIZE = int(os.getenv("POLYGON_POOL_SIZE", "8"))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class RateLimited(Exception):
+    """Raised when a Polygon request would have to wait longer than allowed for the rate limit."""
+
+
+class TokenBucket:
+    """
+    Allows `rate` requests per second on average, in bursts of up to `capacity`. acquire() blocks
+    until a token is free; callers are served in the order they arrive.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout: float | None = None) -> float:
+        """
+        Take a token, waiting for one if none is left. Returns the seconds waited. Raises RateLimited,
+        without taking a token, if the wait would be longer than timeout.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            wait = (1 - self._tokens) / self.rate if self._tokens < 1 else 0.0
+            if timeout is not None and wait > timeout:
+                raise RateLimited(f"Rate limited: the next Polygon request is {wait:.0f}s away")
+            # Reserve the token now, so later callers queue behind this one
+            self._tokens -= 1
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class _LimitedPool:
+    """Stands in for the client's urllib3 pool: each request takes a token and is retried with backoff."""
+
+    def __init__(self, pool: urllib3.PoolManager, bucket: TokenBucket, max_retries: int, backoff: float,
+                 max_wait: float = POLYGON_MAX_WAIT_SECONDS):
+        self.pool = pool
+        self.bucket = bucket
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_wait = max_wait
+        self.requests = 0
+        self.retries = 0
+        self.throttled_seconds = 0.0
+
+    def request(self, method: str, url: str, **kwargs):
+        deadline = time.monotonic() + self.max_wait
+        for attempt in range(self.max_retries + 1):
+            self.throttled_seconds += self.bucket.acquire(timeout=max(0.0, deadline - time.monotonic()))
+            self.requests += 1
+            delay = self.backoff * 2 ** attempt
+            try:
+                response = self.pool.request(method, url, **kwargs)
+            except urllib3.exceptions.HTTPError:
+                if attempt == self.max_retries:
+                    raise
+            else:
+                if response.status not in RETRY_STATUSES or attempt == self.max_retries:
+                    return response
+                retry_after = response.headers.get("Retry-After", "")
+                if retry_after.isdigit():
+                    delay = max(delay, float(retry_after))
+            delay *= random.uniform(1, 1.5)
+            if time.monotonic() + delay > deadline:
+                raise RateLimited(f"Rate limited: Polygon still failing after {attempt + 1} attempts")
+            self.retries += 1
+            time.sleep(delay)
+
+
+class RateLimitedRESTClient(RESTClient):
+    """A RESTClient whose requests share a token bucket and are retried with backoff."""
+
+    def __init__(self, api_key: str, bucket: TokenBucket, max_retries: int = POLYGON_MAX_RETRIES,
+                 backoff: float = POLYGON_BACKOFF_SECONDS):
+        super().__init__(api_key, retries=0)
+        # The same pool RESTClient builds, but keeping POLYGON_POOL_SIZE connections per host, and with
+        # retries left to _LimitedPool, where they also wait for a token
+        pool = urllib3.PoolManager(
+            num_pools=10,
+            maxsize=POLYGON_POOL_SIZE,
+            headers=self.headers,
+            ca_certs=certifi.where(),
+            cert_reqs="CERT_REQUIRED",
+            retries=Retry(0, raise_on_status=False),
+        )
+        self.client = _LimitedPool(pool, bucket, max_retries, backoff)
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.client.requests,
+            "retries": self.client.retries,
+            "throttled_seconds": self.client.throttled_seconds,
+            "requests_per_minute": self.client.bucket.rate * 60,
+        }
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> RateLimitedRESTClient:
+    """The process's shared Polygon client, created on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                rate = POLYGON_REQUESTS_PER_MINUTE / 60
+                # Slow plans may spend a minute's allowance at once; fast ones burst up to a second's worth
+                bucket = TokenBucket(rate, POLYGON_REQUESTS_PER_MINUTE if rate < 1 else rate)
+                _client = RateLimitedRESTClient(polygon_api_key, bucket)
+    return _client
+
+
+def polygon_client_stats() -> dict:
+    """Requests made, retries and time spent waiting for the rate limit by this process's client."""
+    return _client.stats() if _client else {}
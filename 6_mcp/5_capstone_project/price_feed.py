@@ -0,0 +1,72 @@
+"""
+A single price feed for every process that prices shares.
+
+Each trader's MCP servers, the trading floor and the UI run in their own processes, each with its
+own price cache. Left alone, each would fetch the same prices from Polygon, so upstream traffic
+would grow with the number of traders. This feed polls Polygon for the union of every symbol held
+by an account, named in an open order, or recently asked for by any process, with one batched
+request per poll, and publishes the prices to the live_prices table. market.get_share_price and
+get_share_prices read that table first and only go upstream for symbols it lacks or holds stale,
+adding those that come back with a price to the feed's watch list. Holdings are re-read each poll
+only for accounts whose version has changed since the last one.
+
+Run it from this directory alongside the trading floor, for example:
+
+    uv run price_feed.py
+    uv run price_feed.py --interval 30
+    uv run price_feed.py --once
+"""
+
+import argparse
+import time
+from database import read_held_symbols, read_orders, read_watched_symbols, write_live_prices
+from market import fetch_prices_upstream, PRICE_FEED_INTERVAL_SECONDS, PRICE_FEED_WATCH_SECONDS, polygon_api_key
+
+
+# Each account's version and holdings as of the last poll, so only accounts that traded are replayed
+_holdings: dict[str, tuple[int, set[str]]] = {}
+
+
+def feed_symbols() -> list[str]:
+    """Every symbol held, in an open order, or watched, in a stable order."""
+    symbols = read_held_symbols(_holdings)
+    symbols.update(order["symbol"] for order in read_orders())
+    symbols.update(read_watched_symbols(PRICE_FEED_WATCH_SECONDS))
+    return sorted(symbols)
+
+
+def publish_once() -> int:
+    """Fetch and publish one round of prices; returns how many symbols were priced."""
+    symbols = feed_symbols()
+    if not symbols:
+        return 0
+    prices = fetch_prices_upstream(symbols)
+    write_live_prices(prices)
+    return sum(1 for price in prices.values() if price)
+
+
+def run_feed(interval: float = PRICE_FEED_INTERVAL_SECONDS) -> None:
+    """Publish prices every interval seconds until interrupted."""
+    print(f"Publishing prices every {interval:g} seconds")
+    while True:
+        start = time.monotonic()
+        try:
+            priced = publish_once()
+            print(f"Published {priced} prices in {time.monotonic() - start:.2f}s")
+        except Exception as e:
+            print(f"Was not able to publish prices due to {e}; will retry")
+        time.sleep(max(0.0, interval - (time.monotonic() - start)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--interval", type=float, default=PRICE_FEED_INTERVAL_SECONDS, help="seconds between polls")
+    parser.add_argument("--once", action="store_true", help="publish one round of prices and exit")
+    args = parser.parse_args()
+
+    if not polygon_api_key:
+        parser.error("POLYGON_API_KEY is not set; without it prices are made up locally and there is nothing to publish")
+    if args.once:
+        print(f"Published {publish_once()} prices")
+    else:
+        run_feed(args.interval)
@@ -0,0 +1,94 @@
+"""
+Stress test for concurrent writers of one account.
+
+Starts several processes that each load the same account through its own in-process cache and
+trade or deposit as fast as they can, the way the accounts servers of overlapping trader runs do.
+When they finish, it checks that the stored account reflects every operation: no trade or deposit
+may have been lost to a writer working from a stale copy.
+
+It runs against a throwaway database in a temporary directory, with a fixed share price so that
+only database contention is measured. Run from this directory, for example:
+
+    uv run stress_accounts.py --processes 8 --ops 200
+"""
+
+import argparse
+import contextlib
+import io
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+NAME = "stress"
+SYMBOLS = ["AAPL", "MSFT", "NVDA", "AMZN"]
+PRICE = 10.0
+DEPOSIT = 1.0
+
+
+def worker(path: str, index: int, ops: int) -> tuple[int, int, int]:
+    """Run ops operations against the shared account; returns (buys, deposits, conflict retries)."""
+    os.environ["ACCOUNTS_DB"] = path
+    import accounts
+    import database
+
+    accounts.get_share_price = lambda symbol: PRICE
+    accounts.get_share_prices = lambda symbols: {symbol: PRICE for symbol in symbols}
+    buys = deposits = 0
+    # deposit() prints the new balance; keep the output to the summary
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(ops):
+            account = accounts.Account.get(NAME)
+            if (index + i) % 4 == 0:
+                account.deposit(DEPOSIT)
+                deposits += 1
+            else:
+                account.buy_shares(SYMBOLS[(index + i) % len(SYMBOLS)], 1, f"worker {index} op {i}")
+                buys += 1
+    database.flush_logs()
+    return buys, deposits, accounts.conflict_retries
+
+
+def main(processes: int, ops: int) -> bool:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "stress.db")
+        os.environ["ACCOUNTS_DB"] = path
+        import accounts
+
+        accounts.Account.get(NAME).reset("stress")
+        start = time.perf_counter()
+        with multiprocessing.get_context("spawn").Pool(processes) as pool:
+            results = pool.starmap(worker, [(path, index, ops) for index in range(processes)])
+        elapsed = time.perf_counter() - start
+
+        buys = sum(result[0] for result in results)
+        deposits = sum(result[1] for result in results)
+        retries = sum(result[2] for result in results)
+        accounts.Account.invalidate()
+        account = accounts.Account.get(NAME)
+        expected_balance = accounts.INITIAL_BALANCE + deposits * DEPOSIT - buys * PRICE * (1 + accounts.SPREAD)
+
+        total = processes * ops
+        print(f"{total} operations from {processes} processes in {elapsed:.2f}s ({total / elapsed:,.0f} ops/sec)")
+        print(f"{retries} operations re-run after a version conflict")
+        checks = {
+            "transactions": (len(account.transactions), buys),
+            "shares held": (sum(account.holdings.values()), buys),
+            "balance": (round(account.balance, 6), round(expected_balance, 6)),
+            "net invested": (round(account.net_invested, 6), round(buys * PRICE * (1 + accounts.SPREAD), 6)),
+        }
+        ok = True
+        for label, (actual, expected) in checks.items():
+            status = "ok" if actual == expected else "LOST UPDATES"
+            ok &= actual == expected
+            print(f"{label:<14} {actual:>14} expected {expected:>14}  {status}")
+        return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, default=8, help="number of concurrent writer processes")
+    parser.add_argument("--ops", type=int, default=100, help="operations per process")
+    args = parser.parse_args()
+    sys.exit(0 if main(args.processes, args.ops) else 1)
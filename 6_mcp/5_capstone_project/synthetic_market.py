@@ -0,0 +1,250 @@
+"""
+A deterministic synthetic market, used as the price source when there is no Polygon API key
+(or with PRICE_SOURCE=synthetic), for offline runs and load tests.
+
+Every symbol follows a geometric Brownian motion whose daily returns load on a market factor and
+on one of SECTORS sector factors, plus noise of its own, so prices are correlated within and
+across sectors. A symbol's starting price, drift, factor loadings and volatility are derived from
+a hash of its name. The random draws are a hash of (seed, symbol, day), not a sequence, so a price
+depends only on the seed, the symbol and the time it is asked for. It comes out the same in every
+process and on every call, and thousands of symbols are priced together as NumPy arrays.
+
+Daily closes are the cumulative sum of the daily returns from SIMULATOR_START. Only each symbol's
+last CACHED_DAYS closes are kept; later days are extended forward from them, so a long-running
+process neither holds every day since the start nor regenerates it. Within a day the price follows
+one Brownian bridge between two closes, built by midpoint refinement from draws keyed by day and
+minute, so the path is continuous and an order sees the same path however often it looks.
+
+Run from this directory to store daily closes in the database for backtest.py, for example:
+
+    uv run synthetic_market.py --start 2025-01-01 --end 2025-06-30 --symbols 500
+"""
+
+import argparse
+import hashlib
+import os
+import threading
+from datetime import date, datetime, timedelta
+import numpy as np
+from dotenv import load_dotenv
+from market_calendar import holidays
+
+load_dotenv(override=True)
+
+SIMULATOR_SEED = int(os.getenv("SIMULATOR_SEED", "42"))
+# The first simulated day; earlier times are priced as of this day
+SIMULATOR_START = os.getenv("SIMULATOR_START", "2020-01-01")
+
+SECTORS = 11
+MARKET_VOLATILITY = 0.16
+SECTOR_VOLATILITY = 0.18
+DAY = 1 / 365.25
+MINUTES_PER_DAY = 1440
+# Trailing daily closes kept per symbol, and how many days of returns are generated at a time
+CACHED_DAYS = 8
+CHUNK_DAYS = 512
+
+_MULTIPLIER = np.uint64(0xBF58476D1CE4E5B9)
+_MULTIPLIER_2 = np.uint64(0x94D049BB133111EB)
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+# Which kind of draw a hash is for, so the draws of one symbol and day are independent of each other
+_PARAMETERS, _FACTORS, _RETURNS, _BRIDGE = 1, 2, 3, 4
+
+
+def _mix(x: np.ndarray) -> np.ndarray:
+    """The splitmix64 finalizer: scrambles 64-bit integers into well-distributed ones."""
+    x = x ^ (x >> np.uint64(30))
+    x = x * _MULTIPLIER
+    x = x ^ (x >> np.uint64(27))
+    x = x * _MULTIPLIER_2
+    return x ^ (x >> np.uint64(31))
+
+
+def _uniforms(keys: np.ndarray, counters: np.ndarray, stream: int, seed: int) -> np.ndarray:
+    """A uniform draw in (0, 1) for each (key, counter) pair, broadcast together."""
+    with np.errstate(over="ignore"):
+        salt = _mix(np.uint64(seed) * _GOLDEN + np.uint64(stream))
+        x = _mix(keys ^ _mix(np.asarray(counters, dtype=np.uint64) * _GOLDEN ^ salt))
+    return ((x >> np.uint64(11)).astype(np.float64) + 0.5) / 2.0 ** 53
+
+
+def _normals(keys: np.ndarray, counters: np.ndarray, stream: int, seed: int) -> np.ndarray:
+    """A standard normal draw for each (key, counter) pair (Box-Muller on two hashed uniforms)."""
+    u1 = _uniforms(keys, counters, stream, seed)
+    u2 = _uniforms(keys, counters, stream + 100, seed)
+    return np.sqrt(-2 * np.log(u1)) * np.cos(2 * np.pi * u2)
+
+
+def _symbol_keys(symbols: list[str]) -> np.ndarray:
+    # hash() differs between processes, so derive the key from the name itself
+    return np.array(
+        [int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "little") for s in symbols],
+        dtype=np.uint64,
+    )
+
+
+def _variance(p: dict[str, np.ndarray]) -> np.ndarray:
+    # The annual variance of a symbol's log returns, from both factors and its own noise
+    return (p["beta"] * MARKET_VOLATILITY) ** 2 + (p["sector_beta"] * SECTOR_VOLATILITY) ** 2 + p["volatility"] ** 2
+
+
+class SyntheticMarket:
+    """Correlated GBM price paths keyed by symbol and time, generated on demand and cached per symbol."""
+
+    def __init__(self, seed: int = SIMULATOR_SEED, start: str = SIMULATOR_START):
+        self.seed = seed
+        self.start = datetime.fromisoformat(start)
+        # The first day and the log closes from then on of the latest days generated for each symbol
+        self._windows: dict[str, tuple[int, np.ndarray]] = {}
+        self._lock = threading.Lock()
+
+    def _parameters(self, keys: np.ndarray) -> dict[str, np.ndarray]:
+        u = _uniforms(keys[:, None], np.arange(6), _PARAMETERS, self.seed)
+        return {
+            "sector": (keys % np.uint64(SECTORS)).astype(np.int64),
+            "start_price": np.exp(np.log(5) + u[:, 0] * np.log(100)),
+            "drift": -0.05 + 0.20 * u[:, 1],
+            "beta": 0.5 + u[:, 2],
+            "sector_beta": 0.3 + 0.7 * u[:, 3],
+            "volatility": 0.15 + 0.30 * u[:, 4],
+        }
+
+    def _returns(self, keys: np.ndarray, p: dict[str, np.ndarray], first: int, last: int) -> np.ndarray:
+        """The daily log return of each symbol on days first..last, as a symbols x days array."""
+        days = np.arange(first, last + 1)
+        scale = np.array([MARKET_VOLATILITY] + [SECTOR_VOLATILITY] * SECTORS) * np.sqrt(DAY)
+        factors = _normals(np.arange(1 + SECTORS, dtype=np.uint64)[None, :], days[:, None], _FACTORS, self.seed) * scale
+        noise = _normals(keys[:, None], days[None, :], _RETURNS, self.seed)
+        # Subtracting half the variance makes drift the expected growth rate of the price itself
+        growth = p["drift"] - _variance(p) / 2
+        return (
+            growth[:, None] * DAY
+            + p["beta"][:, None] * factors[:, 0][None, :]
+            + p["sector_beta"][:, None] * factors[:, 1 + p["sector"]].T
+            + p["volatility"][:, None] * np.sqrt(DAY) * noise
+        )
+
+    def _log_closes(self, symbols: list[str], first: int, last: int) -> np.ndarray:
+        """The log close of each symbol on days first..last, as a symbols x days array."""
+        closes = np.empty((len(symbols), last - first + 1))
+        # Symbols are grouped by the day they continue from: the end of a cached window that starts by
+        # first, or day -1 (the starting price) for the rest, which are generated from the beginning
+        groups: dict[int, list[int]] = {}
+        for i, symbol in enumerate(symbols):
+            window = self._windows.get(symbol)
+            if window and window[0] <= first:
+                cached = min(last, window[0] + len(window[1]) - 1)
+                closes[i, :max(0, cached - first + 1)] = window[1][first - window[0]:cached - window[0] + 1]
+                groups.setdefault(cached, []).append(i)
+            else:
+                groups.setdefault(-1, []).append(i)
+        for day, rows in groups.items():
+            if day == last:
+                continue
+            keys = _symbol_keys([symbols[i] for i in rows])
+            p = self._parameters(keys)
+            level = (
+                np.log(p["start_price"]) if day < 0
+                else np.array([self._windows[symbols[i]][1][-1] for i in rows])
+            )
+            # Days before first are only summed into the level, a chunk at a time to bound memory
+            while day < last:
+                end = min(last, day + CHUNK_DAYS)
+                path = level[:, None] + np.cumsum(self._returns(keys, p, day + 1, end), axis=1)
+                begin = max(first, day + 1)
+                if begin <= end:
+                    closes[np.array(rows)[:, None], np.arange(begin - first, end - first + 1)[None, :]] = (
+                        path[:, begin - day - 1:]
+                    )
+                level, day = path[:, -1], end
+        keep = max(first, last - CACHED_DAYS + 1)
+        for symbol, row in zip(symbols, closes):
+            window = self._windows.get(symbol)
+            # Only move a window forward; a look back at history leaves it where it is
+            if not window or window[0] + len(window[1]) - 1 <= last:
+                self._windows[symbol] = (keep, row[keep - first:].copy())
+        return closes
+
+    def _bridge(self, keys: np.ndarray, day: int, minute: int) -> np.ndarray:
+        """
+        A standard Brownian bridge, pinned to 0 at both ends of the day, at a minute into it. The value
+        is refined from each interval's midpoint, drawn given the interval's ends, so every minute of a
+        day is a point on the same path.
+        """
+        lo, hi = 0, MINUTES_PER_DAY
+        at_lo, at_hi = np.zeros(len(keys)), np.zeros(len(keys))
+        while minute not in (lo, hi):
+            mid = (lo + hi) // 2
+            draws = _normals(keys, np.full(len(keys), day * MINUTES_PER_DAY + mid), _BRIDGE, self.seed)
+            at_mid = (
+                at_lo + (mid - lo) / (hi - lo) * (at_hi - at_lo)
+                + np.sqrt((mid - lo) * (hi - mid) / (hi - lo)) * draws
+            )
+            if minute < mid:
+                hi, at_hi = mid, at_mid
+            else:
+                lo, at_lo = mid, at_mid
+        return at_lo if minute == lo else at_hi
+
+    def prices(self, symbols, when: datetime | None = None) -> dict[str, float]:
+        """The price of each symbol at a time (now by default), to the cent."""
+        symbols = list(dict.fromkeys(symbols))
+        if not symbols:
+            return {}
+        elapsed = max(0.0, ((when or datetime.now()) - self.start).total_seconds() / 86400)
+        day, minute = int(elapsed), int(elapsed % 1 * MINUTES_PER_DAY)
+        fraction = minute / MINUTES_PER_DAY
+        with self._lock:
+            closes = self._log_closes(symbols, day, day + 1)
+        keys = _symbol_keys(symbols)
+        # The bridge runs from this day's close to the next one's, one step a minute
+        log_prices = (
+            (1 - fraction) * closes[:, 0] + fraction * closes[:, 1]
+            + np.sqrt(_variance(self._parameters(keys)) * DAY / MINUTES_PER_DAY) * self._bridge(keys, day, minute)
+        )
+        return dict(zip(symbols, np.round(np.exp(log_prices), 2).tolist()))
+
+    def daily_closes(self, symbols: list[str], start: str, end: str) -> tuple[list[str], np.ndarray]:
+        """The closes on trading days between two dates, as the dates and a dates x symbols array."""
+        first, last = date.fromisoformat(start), date.fromisoformat(end)
+        dates = [first + timedelta(days=i) for i in range((last - first).days + 1)]
+        dates = [d for d in dates if d.weekday() < 5 and d not in holidays(d.year)]
+        offsets = np.array([max(0, (d - self.start.date()).days) for d in dates], dtype=np.int64)
+        if not dates:
+            return [], np.empty((0, len(symbols)))
+        first = int(offsets.min())
+        with self._lock:
+            closes = self._log_closes(symbols, first, int(offsets.max()))
+        return [d.isoformat() for d in dates], np.round(np.exp(closes[:, offsets - first].T), 2)
+
+
+_market = SyntheticMarket()
+
+
+def get_synthetic_prices(symbols, when: datetime | None = None) -> dict[str, float]:
+    """Prices from the shared simulator; the same symbol and time always give the same price."""
+    return _market.prices(symbols, when)
+
+
+def synthetic_symbols(count: int) -> list[str]:
+    """A universe of made-up four-letter tickers, always the same for a given count."""
+    letters = np.array(list("ABCDEFGHIJKLMNOPQRSTUVWXYZ"))
+    index = np.arange(count)
+    codes = np.stack([(index // 26 ** i) % 26 for i in range(3, -1, -1)], axis=1)
+    return ["".join(row) for row in letters[codes]]
+
+
+if __name__ == "__main__":
+    from database import write_market
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--start", required=True, help="first date, YYYY-MM-DD")
+    parser.add_argument("--end", required=True, help="last date, YYYY-MM-DD")
+    parser.add_argument("--symbols", type=int, default=100, help="how many made-up tickers to simulate")
+    args = parser.parse_args()
+
+    universe = synthetic_symbols(args.symbols)
+    dates, closes = _market.daily_closes(universe, args.start, args.end)
+    for day, row in zip(dates, closes):
+        write_market(day, dict(zip(universe, row.tolist())))
+    print(f"Stored {len(dates)} days of closes for {len(universe)} synthetic symbols")
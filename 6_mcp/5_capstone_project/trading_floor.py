@@ -13,8 +13,20 @@ from tracers import LogTracer
 # Import function to register a trace processor with the agent system
 from agents import add_trace_processor
 
-# Import function to check if the market is currently open
-from market import is_market_open
+# Import functions to check if the market is currently open, and how long until it next opens, from the local calendar
+from market import is_market_open, seconds_until_market_opens
+
+# Import the Account model, used to record each trader's portfolio value after a run
+from accounts import Account
+
+# Import the matching pass that fills resting limit and stop orders once their trigger price is reached
+from order_matching import match_orders
+
+# Import the database worker pool, so account reads and writes stay off the event loop
+from async_database import run
+
+# Import the log retention job and its settings, so the logs table is trimmed between runs
+from log_maintenance import prune_logs, LOG_RETENTION_DAYS, LOG_RETENTION_ROWS_PER_TRADER
 
 # Import dotenv loader to read environment variables from a .env file
 from dotenv import load_dotenv
@@ -33,6 +45,9 @@ RUN_EVEN_WHEN_MARKET_IS_CLOSED = (
     os.getenv("RUN_EVEN_WHEN_MARKET_IS_CLOSED", "true").strip().lower() == "true"
 )
 
+# Decide whether a scheduler that skips closed markets sleeps until the next open rather than checking every N minutes (default: true)
+SLEEP_UNTIL_MARKET_OPENS = os.getenv("SLEEP_UNTIL_MARKET_OPENS", "true").strip().lower() == "true"
+
 # Decide whether to use multiple different models for the traders, based on environment variable (default: false)
 USE_MANY_MODELS = os.getenv("USE_MANY_MODELS", "false").strip().lower() == "true"
 
@@ -78,11 +93,38 @@ async def run_every_n_minutes():
         if RUN_EVEN_WHEN_MARKET_IS_CLOSED or is_market_open():
             # Run all traders concurrently using asyncio.gather
             await asyncio.gather(*[trader.run() for trader in traders])
+            # Pricing now raises rather than making prices up when Polygon stays unavailable, so keep the loop alive
+            # Record one portfolio value sample per trader; report() reads no longer write samples
+            for name in names:
+                # Guard each trader on its own, so one failed valuation does not skip the others
+                try:
+                    await run(lambda: Account.get(name).mark_to_market())
+                except Exception as e:
+                    # Report the failure and try again on the next run
+                    print(f"Was not able to value {name}'s account due to {e}")
+            # Fill any resting orders triggered by the latest prices, in one batched pass over all accounts
+            try:
+                await run(match_orders)
+            except Exception as e:
+                # Report the failure and try again on the next run
+                print(f"Was not able to match orders due to {e}")
         else:
             # If market is closed and override is not enabled, skip this run
             print("Market is closed, skipping run")
-        # Wait for the specified interval before the next run
-        await asyncio.sleep(RUN_EVERY_N_MINUTES * 60)
+        # Trim old log rows in a worker thread, if retention is configured, without blocking the event loop
+        if LOG_RETENTION_DAYS or LOG_RETENTION_ROWS_PER_TRADER:
+            await asyncio.to_thread(prune_logs)
+        # Work out how long the market stays closed, if runs are skipped while it is
+        until_open = 0 if RUN_EVEN_WHEN_MARKET_IS_CLOSED or not SLEEP_UNTIL_MARKET_OPENS else seconds_until_market_opens()
+        # Sleep through the closed market in one go, waking when it opens rather than up to an interval later
+        if until_open > 0:
+            # Report when the next run will happen
+            print(f"Market is closed, sleeping {until_open / 3600:.1f} hours until it opens")
+            # Wait until the market opens
+            await asyncio.sleep(until_open)
+        else:
+            # Wait for the specified interval before the next run
+            await asyncio.sleep(RUN_EVERY_N_MINUTES * 60)
 
 # Entry point: if this script is run directly, start the trading scheduler
 if __name__ == "__main__":